@@ -15,18 +15,144 @@ You should have received a copy of the GNU General Public License along with thi
 If not, see <http://www.gnu.org/licenses/>.
 """
 
+import functools
 import hashlib
+import json
 import logging
+import mmap
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-# For calculating checksum
-CHUNK_SIZE = 8192
+# For calculating checksum if file can't be memory-mapped
+CHUNK_SIZE = 1 << 20
+
+# Supported checksum algorithms
+HASH_FACTORIES = {"sha1": hashlib.sha1, "md5": hashlib.md5, "sha256": hashlib.sha256, "sha512": hashlib.sha512}
+
+# Supported checksum algorithms from the strongest to the weakest
+CHECKSUM_ALGS_PRIORITY = ["sha512", "sha256", "sha1", "md5"]
+
+# Suffix of file that stores size and modification time of successfully verified artifact
+VERIFIED_SUFFIX = ".verified"
+
+# Extensions that can be specified in artifact name (old style)
+KNOWN_EXTENSIONS = frozenset({".jar", ".zip", ".dll", ".so"})
 
 # Default artifact url if none is specified
 URL_DEFAULT = "https://libraries.minecraft.net/"
 
+# Keys of artifact's JSON that are needed after Artifact's __init__() (or for logging) and must be kept when pickling it
+STATE_KEYS = frozenset(["name", "size", "checksum", "checksums", *CHECKSUM_ALGS_PRIORITY])
+
+
+@functools.lru_cache(maxsize=None)
+def _sha_extensions() -> bool:
+    """Checks if CPU has SHA extensions (SHA-NI on x86 or sha2 on ARMv8). Linux only
+
+    Returns:
+        bool: True if SHA-256 is hardware-accelerated
+    """
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8", errors="replace") as cpuinfo_io:
+            for line in cpuinfo_io:
+                if line.startswith("flags") or line.startswith("Features"):
+                    flags = line.partition(":")[2].split()
+                    return "sha_ni" in flags or "sha2" in flags
+    except OSError:
+        pass
+    return False
+
+
+def _hash_file(file_hash, file_path: str) -> None:
+    """Feeds file's content into hash object
+    Non-empty files are memory-mapped and hashed by a single update() call without any Python-level loop
+
+    Args:
+        file_hash: hashlib's hash object
+        file_path (str): path to file to hash
+    """
+    with open(file_path, "rb") as file_io:
+        # Read-ahead hints are not available on Windows and macOS
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(file_io.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+
+        # mmap doesn't support empty files
+        if os.fstat(file_io.fileno()).st_size != 0:
+            try:
+                with mmap.mmap(file_io.fileno(), 0, access=mmap.ACCESS_READ) as file_mm:
+                    # Not available on Windows
+                    if hasattr(file_mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                        file_mm.madvise(mmap.MADV_SEQUENTIAL)
+                    file_hash.update(file_mm)
+                return
+            except (OSError, ValueError) as e:
+                logging.debug(f"Unable to map {file_path} into memory: {e}. Reading it by chunks")
+
+        # hashlib.file_digest() is available since Python 3.11
+        if hasattr(hashlib, "file_digest"):
+            hashlib.file_digest(file_io, lambda: file_hash)
+            return
+
+        # Reuse the same buffer instead of allocating new bytes for each chunk
+        buffer = bytearray(CHUNK_SIZE)
+        buffer_view = memoryview(buffer)
+        while True:
+            size = file_io.readinto(buffer)
+            if not size:
+                break
+            file_hash.update(buffer_view[:size])
+
+
+def build_verified_info(file_stat: os.stat_result, checksums: list[tuple[str, str]]) -> dict:
+    """Builds content of VERIFIED_SUFFIX file
+
+    Args:
+        file_stat (os.stat_result): stat of verified file
+        checksums (list[tuple[str, str]]): valid checksums of file as [(alg, checksum), ...]
+
+    Returns:
+        dict: size, modification time and checksums of file
+    """
+    return {
+        "size": file_stat.st_size,
+        "mtime_ns": file_stat.st_mtime_ns,
+        "checksums": [list(alg_checksum) for alg_checksum in checksums],
+    }
+
+
+def is_verified(file_path: str, file_stat: os.stat_result, checksums: list[tuple[str, str]]) -> bool:
+    """Checks if file wasn't modified since it was verified (see Artifact.mark_verified())
+
+    Args:
+        file_path (str): path to file
+        file_stat (os.stat_result): current stat of file
+        checksums (list[tuple[str, str]]): expected checksums of file as [(alg, checksum), ...]
+
+    Returns:
+        bool: True if file + VERIFIED_SUFFIX matches file's size, modification time and checksums
+    """
+    try:
+        with open(file_path + VERIFIED_SUFFIX, "r", encoding="utf-8") as verified_file_io:
+            return json.load(verified_file_io) == build_verified_info(file_stat, checksums)
+    except (OSError, ValueError):
+        return False
+
 
 class Artifact:
+    __slots__ = (
+        "_artifact",
+        "_parent_dir",
+        "_unpack_into",
+        "_exclude_files",
+        "_copy_to",
+        "_path",
+        "_url",
+        "_artifact_path",
+    )
+
     def __init__(
         self,
         artifact: dict,
@@ -34,31 +160,32 @@ class Artifact:
         target_file: str | None = None,
         unpack_into: str | None = None,
         exclude_files: list[str] | None = None,
-        copy_to: str | None = None,
+        copy_to: list[str] | None = None,
     ):
         """Initializes Artifact instance. This class in a wrapper and container for artifact from JSON
 
         Args:
-            artifact (dict): artifact's JSON as dictionary
+            artifact (dict): artifact's JSON as dictionary. It's not copied, so don't modify it afterwards
             parent_dir (str): artifact's parent dir
             target_file (str | None): path to artifact file (relative to parent_dir) to overwrite artifact["path"]
             unpack_into (str | None, optional): path to unpack file after downloading it. Defaults to None
             exclude_files (list[str] | None, optional): list of files to exclude while unpacking. Defaults to None
-            copy_to (str | None): copy downloaded file to another file
+            copy_to (list[str] | None): copy downloaded file to other files
         """
-        self._artifact = artifact.copy()
+        self._artifact = artifact
         self._parent_dir = parent_dir
         self._unpack_into = unpack_into
         self._exclude_files = exclude_files
         self._copy_to = copy_to
 
-        if target_file:
-            self._artifact["path"] = target_file
+        # These can be overwritten without modifying artifact's dict
+        self._path = target_file if target_file else artifact.get("path")
+        self._url = artifact.get("url")
 
         # Old style
         # Ex.: net.fabricmc:sponge-mixin:0.13.3+mixin.0.8.5 ->
         # net/fabricmc/sponge-mixin/0.13.3+mixin.0.8.5/sponge-mixin-0.13.3+mixin.0.8.5.jar
-        if "path" not in self._artifact and "name" in self._artifact:
+        if self._path is None and "name" in self._artifact:
             package_name_version = self._artifact["name"].split(":")
             if len(package_name_version) != 3:
                 logging.warning(f"Unknown artifact name format: {self._artifact['name']}")
@@ -69,28 +196,65 @@ class Artifact:
                 uri_from_name = f"{package}/{name}/{version}/{name}-{version}"
 
                 # Split extension (just in case) i think this will never be useful and may be even wrong :)
-                ext = ".jar"
-                for ext_ in [".jar", ".zip", ".dll", ".so"]:
-                    if uri_from_name.endswith(ext_):
-                        ext = ext_
-                        uri_from_name = uri_from_name[: -len(ext_)]
-                        break
+                uri_base, dot, ext = uri_from_name.rpartition(".")
+                ext = dot + ext
+                if dot and ext in KNOWN_EXTENSIONS:
+                    uri_from_name = uri_base
+                else:
+                    ext = ".jar"
 
                 # Set this as path
-                self._artifact["path"] = uri_from_name + ext
+                self._path = f"{uri_from_name}{ext}"
 
                 # VERY old format
-                if "url" not in self._artifact:
-                    self._artifact["url"] = URL_DEFAULT
+                url = self._url if self._url is not None else URL_DEFAULT
+                if not url.endswith("/"):
+                    url += "/"
 
                 # Fix for old forge versions
-                if package == "net/minecraftforge":
-                    uri_from_name += "-universal"
+                suffix = "-universal" if package == "net/minecraftforge" else ""
 
                 # Append to the url
-                if not self._artifact["url"].endswith("/"):
-                    self._artifact["url"] += "/"
-                self._artifact["url"] += uri_from_name + ext
+                self._url = f"{url}{uri_from_name}{suffix}{ext}"
+
+        # Full path to artifact (will not change)
+        self._artifact_path = os.path.join(self._parent_dir, self._path) if self._path is not None else None
+
+    def __getstate__(self) -> tuple:
+        """Compact pickling state used when artifact is sent to resolver processes via multiprocessing queue
+        Slots are packed into a plain tuple and artifact's JSON is reduced to keys that are still used after
+        __init__() (size, checksums and name for logging), so url, path, etc. are not pickled twice
+
+        Returns:
+            tuple: (artifact, parent_dir, unpack_into, exclude_files, copy_to, path, url)
+        """
+        artifact = {key: value for key, value in self._artifact.items() if key in STATE_KEYS}
+        return (
+            artifact,
+            self._parent_dir,
+            self._unpack_into,
+            self._exclude_files,
+            self._copy_to,
+            self._path,
+            self._url,
+        )
+
+    def __setstate__(self, state: tuple) -> None:
+        """Restores artifact from __getstate__() output
+
+        Args:
+            state (tuple): (artifact, parent_dir, unpack_into, exclude_files, copy_to, path, url)
+        """
+        (
+            self._artifact,
+            self._parent_dir,
+            self._unpack_into,
+            self._exclude_files,
+            self._copy_to,
+            self._path,
+            self._url,
+        ) = state
+        self._artifact_path = os.path.join(self._parent_dir, self._path) if self._path is not None else None
 
     @property
     def parent_dir(self) -> str:
@@ -117,10 +281,10 @@ class Artifact:
         return self._exclude_files
 
     @property
-    def copy_to(self) -> str | None:
+    def copy_to(self) -> list[str] | None:
         """
         Returns:
-            str | None: copy downloaded file to another file
+            list[str] | None: copy downloaded file to other files
         """
         return self._copy_to
 
@@ -130,7 +294,15 @@ class Artifact:
         Returns:
             str | None: artifact["path"] or target_file or None if none of them defined
         """
-        return self._artifact.get("path")
+        return self._path
+
+    @property
+    def artifact_path(self) -> str | None:
+        """
+        Returns:
+            str | None: full path to artifact (parent_dir/path) or None if path is not defined
+        """
+        return self._artifact_path
 
     @property
     def url(self) -> str | None:
@@ -138,7 +310,7 @@ class Artifact:
         Returns:
             str | None: artifact["url"] or None if no URL
         """
-        return self._artifact.get("url")
+        return self._url
 
     @property
     def size(self) -> int:
@@ -153,28 +325,21 @@ class Artifact:
         """Checks if target file exists
 
         Returns:
-            bool: True if self._parent_dir/self._artifact["path"] exists
+            bool: True if self._parent_dir/self.path exists
         """
-        if not "path" in self._artifact:
+        if self._artifact_path is None:
             return False
-        artifact_path = os.path.join(self._parent_dir, self._artifact["path"])
-        if not os.path.exists(artifact_path):
+        if not os.path.exists(self._artifact_path):
             return False
         return True
 
-    def verify_checksum(self) -> bool:
-        """Calculate artifact's checksum
-
+    def _allowed_checksums(self) -> list[tuple[str, str]]:
+        """
         Returns:
-            bool: True if artifact doesn't have a checksum or it's checksum is valid or False if not
+            list[tuple[str, str]]: all checksums specified in artifact's JSON as [(alg, checksum), ...]
         """
-        if not self.artifact_exists:
-            logging.debug("Unable to calculate checksum. No artifact or it doesn't exist")
-            return True
-
-        # [(alg, checksum), ...]
         allowed_checksums = []
-        for alg in ["sha1", "md5", "sha256", "sha512"]:
+        for alg in CHECKSUM_ALGS_PRIORITY:
             if alg in self._artifact:
                 allowed_checksums.append((alg, self._artifact[alg]))
 
@@ -188,38 +353,173 @@ class Artifact:
                 for checksum in self._artifact["checksums"]:
                     allowed_checksums.append(("sha1", checksum))
 
-        # Return True if no checksums available
-        if len(allowed_checksums) == 0:
-            logging.warning(f"No checksums for {self._artifact.get('name', str(self._artifact))} artifact")
+        return allowed_checksums
+
+    def fast_verify(self) -> bool:
+        """Same as verify_checksum() but skips hashing if artifact wasn't modified since the last verification
+        Size and modification time of verified artifact are stored in artifact_path + VERIFIED_SUFFIX file
+
+        Returns:
+            bool: True if artifact doesn't have a checksum or it's checksum is valid or False if not
+        """
+        allowed_checksums = self._allowed_checksums()
+        if not allowed_checksums or not self.artifact_exists:
+            return self.verify_checksum()
+
+        # Check if artifact was already verified
+        if is_verified(self._artifact_path, os.stat(self._artifact_path), allowed_checksums):
+            logging.debug(f"Artifact {self._artifact_path} was already verified")
             return True
 
-        # Verify
-        for alg, checksum in allowed_checksums:
-            if alg == "sha1":
-                file_hash = hashlib.sha1(usedforsecurity=False)
-            elif alg == "md5":
-                file_hash = hashlib.md5(usedforsecurity=False)
-            elif alg == "sha256":
-                file_hash = hashlib.sha256(usedforsecurity=False)
-            elif alg == "sha512":
-                file_hash = hashlib.sha512(usedforsecurity=False)
-            else:
-                logging.error(f"Unknown checksum algorithm: {alg}")
-                return False
+        if not self.verify_checksum():
+            return False
 
-            artifact_path = os.path.join(self._parent_dir, self._artifact["path"])
-            with open(artifact_path, "rb") as artifact_io:
-                chunk = artifact_io.read(CHUNK_SIZE)
-                while chunk:
-                    file_hash.update(chunk)
-                    chunk = artifact_io.read(CHUNK_SIZE)
+        self.mark_verified()
+        return True
+
+    def mark_verified(self) -> None:
+        """Saves size and modification time of artifact so fast_verify() will not hash it next time
+        Call it only if artifact's checksum is known to be valid
+        """
+        verified_info = self._verified_info()
+        if verified_info is None:
+            return
+        verified_file = self._artifact_path + VERIFIED_SUFFIX
+        try:
+            # Write atomically so interrupted write will not leave corrupted file
+            with open(verified_file + ".tmp", "w+", encoding="utf-8") as verified_file_io:
+                json.dump(verified_info, verified_file_io)
+            os.replace(verified_file + ".tmp", verified_file)
+        except OSError as e:
+            logging.debug(f"Unable to write {verified_file}: {e}")
+
+    def _verified_info(self) -> dict | None:
+        """
+        Returns:
+            dict | None: size, modification time and checksums of existing artifact or None if there is nothing to save
+        """
+        allowed_checksums = self._allowed_checksums()
+        if not allowed_checksums or not self.artifact_exists:
+            return None
+
+        return build_verified_info(os.stat(self._artifact_path), allowed_checksums)
+
+    def verify_checksum(self) -> bool:
+        """Calculate artifact's checksum
 
-            checksum_ = file_hash.hexdigest()
-            logging.debug(f"Calculated {alg} checksum: {checksum_}")
+        Returns:
+            bool: True if artifact doesn't have a checksum or it's checksum is valid or False if not
+        """
+        if not self.artifact_exists:
+            logging.debug("Unable to calculate checksum. No artifact or it doesn't exist")
+            return True
+
+        # Partially downloaded or corrupted files usually have a different size, so there is no need to hash them
+        expected_size = self._artifact.get("size")
+        if expected_size:
+            actual_size = os.path.getsize(self._artifact_path)
+            if actual_size != expected_size:
+                logging.warning(
+                    f"Wrong size of {self._artifact.get('name', str(self._artifact))} artifact."
+                    f" Expected: {expected_size}, actual: {actual_size}"
+                )
+                return False
 
-            if checksum_.lower() == checksum.lower():
-                logging.debug("Checksum is valid")
+        file_hash = self.new_hasher()
+        if file_hash is None:
+            # Return True if no checksums available
+            if not self._allowed_checksums():
+                logging.warning(f"No checksums for {self._artifact.get('name', str(self._artifact))} artifact")
                 return True
 
+            # Unknown algorithm
+            return False
+
+        # Verify
+        _hash_file(file_hash, self._artifact_path)
+        return self.verify_hasher(file_hash)
+
+    def new_hasher(self):
+        """Creates hash object for the strongest (or the fastest) algorithm listed in artifact's JSON
+        Use it to calculate checksum while downloading artifact and then call verify_hasher()
+
+        Returns:
+            hashlib's hash object or None if artifact doesn't have checksums or algorithm is unknown
+        """
+        allowed_checksums = self._allowed_checksums()
+        if len(allowed_checksums) == 0:
+            return None
+
+        # Hash file only once using the strongest available algorithm
+        available_algs = {alg_ for alg_, _ in allowed_checksums}
+
+        # SHA-256 is much faster than any other algorithm on CPUs with SHA extensions
+        if "sha256" in available_algs and _sha_extensions():
+            alg = "sha256"
+        else:
+            alg = next(alg_ for alg_ in CHECKSUM_ALGS_PRIORITY if alg_ in available_algs)
+
+        hash_factory = HASH_FACTORIES.get(alg)
+        if hash_factory is None:
+            logging.error(f"Unknown checksum algorithm: {alg}")
+            return None
+        return hash_factory(usedforsecurity=False)
+
+    def verify_hasher(self, file_hash) -> bool:
+        """Compares digest of hash object from new_hasher() with artifact's checksums
+
+        Args:
+            file_hash: hash object from new_hasher() that was fed with the entire artifact
+
+        Returns:
+            bool: True if checksum is valid or False if not
+        """
+        checksums = [checksum.lower() for alg_, checksum in self._allowed_checksums() if alg_ == file_hash.name]
+        checksum_ = file_hash.hexdigest()
+        logging.debug(f"Calculated {file_hash.name} checksum: {checksum_}")
+
+        if checksum_.lower() in checksums:
+            logging.debug("Checksum is valid")
+            return True
+
         logging.warning(f"Wrong checksum of {self._artifact.get('name', str(self._artifact))} artifact")
         return False
+
+
+def _prefetch(file_paths: list[str]) -> None:
+    """Submits asynchronous read-ahead of files (POSIX only, does nothing on other platforms)
+
+    Args:
+        file_paths (list[str]): paths to files that will be read soon
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for file_path in file_paths:
+        try:
+            file_fd = os.open(file_path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(file_fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(file_fd)
+
+
+def verify_artifacts(artifacts: list[Artifact], workers: int) -> list[bool]:
+    """Verifies checksums of multiple artifacts in parallel
+    hashlib releases the GIL while hashing, so threads are enough here
+
+    Args:
+        artifacts (list[Artifact]): artifacts to verify
+        workers (int): number of threads (ex. "resolver_processes" from config)
+
+    Returns:
+        list[bool]: result of fast_verify() for each artifact (in the same order)
+    """
+    # Let kernel read all files in background while we're hashing first ones
+    _prefetch([artifact_.artifact_path for artifact_ in artifacts if artifact_.artifact_path])
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        return list(executor.map(Artifact.fast_verify, artifacts))
@@ -16,11 +16,19 @@ If not, see <http://www.gnu.org/licenses/>.
 """
 
 import argparse
+import atexit
+import functools
 import json
 import logging
 import os
+import threading
 from typing import Any
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from mml._version import __version__
 from mml.rules_check import os_name
 
@@ -38,13 +46,33 @@ def get_default_game_dir(os_name_: str) -> str:
     elif os_name_ == "windows":
         return os.path.join(os.getenv("APPDATA"), ".minecraft")
     elif os_name_ == "osx":
-        os.path.join(os.path.expanduser("~"), "Library", "Application Support", ".minecraft")
+        return os.path.join(os.path.expanduser("~"), "Library", "Application Support", ".minecraft")
+
 
+@functools.lru_cache(maxsize=None)
+def config_default() -> dict:
+    """Builds default config on the first call (not at import time)
 
-CONFIG_DEFAULT = {"game_dir": get_default_game_dir(os_name()), "resolver_processes": 4}
+    Returns:
+        dict: default values of config keys
+    """
+    return {"game_dir": get_default_game_dir(os_name()), "resolver_processes": 4}
 
 
 class ConfigManager:
+    __slots__ = (
+        "_config_file",
+        "_config",
+        "_args_d",
+        "_sources",
+        "_sources_ignore_args",
+        "_cache",
+        "_lock",
+        "_changes_counter",
+        "_saved_counter",
+        "_save_request",
+    )
+
     def __init__(self, config_file: str, args: argparse.Namespace) -> None:
         """Initializes ConfigManager and reads config file
 
@@ -62,47 +90,105 @@ class ConfigManager:
         # Try to load config file
         if os.path.exists(config_file):
             logging.debug(f"Loading {config_file}")
-            with open(config_file, encoding="utf-8", errors="replace") as config_file_io:
-                json_content = json.load(config_file_io)
-                if json_content is not None and isinstance(json_content, dict):
-                    self._config = json_content
-                else:
-                    logging.warning(f"Unable to load config from {config_file}")
+            if orjson is not None:
+                with open(config_file, "rb") as config_file_io:
+                    json_content = orjson.loads(config_file_io.read().decode("utf-8", errors="replace"))
+            else:
+                with open(config_file, encoding="utf-8", errors="replace") as config_file_io:
+                    json_content = json.load(config_file_io)
+            if json_content is not None and isinstance(json_content, dict):
+                self._config = json_content
+            else:
+                logging.warning(f"Unable to load config from {config_file}")
         else:
             logging.warning(f"File {config_file} doesn't exist")
 
+        # Sources for get() in priority order
+        self._sources = (self._args_d, self._config, config_default())
+        self._sources_ignore_args = (self._config, config_default())
+
+        # {(key, ignore_args): value or None, ...}
+        self._cache: dict[tuple[str, bool], Any] = {}
+
+        # Config is saved by _saver_loop() so multiple set() calls are written at once
+        self._lock = threading.Lock()
+        self._changes_counter = 0
+        self._saved_counter = 0
+        self._save_request = threading.Event()
+        threading.Thread(target=self._saver_loop, daemon=True).start()
+
+        # Save the latest changes before exiting
+        atexit.register(self.save)
+
     def get(self, key: str, default_value: Any | None = None, ignore_args: bool = False) -> Any:
         """Retrieves value from args or config by key
-        Priority: args -> config -> CONFIG_DEFAULT -> default_value
+        Priority: args -> config -> config_default() -> default_value
 
         Args:
             key (str): config key to get value of
-            default_value (Any | None): value to return if key doesn't exists even in CONFIG_DEFAULT
+            default_value (Any | None): value to return if key doesn't exists even in default config
             ignore_args (bool or None, optional): True to ignore self._args_d
 
         Returns:
             Any: key's value or default_value
         """
-        sources = [self._config, CONFIG_DEFAULT] if ignore_args else [self._args_d, self._config, CONFIG_DEFAULT]
-        for source in sources:
-            value = source.get(key)
-            if value is not None:
-                return value
+        cache_key = (key, ignore_args)
+        if cache_key in self._cache:
+            value = self._cache[cache_key]
+        else:
+            value = None
+            for source in self._sources_ignore_args if ignore_args else self._sources:
+                value = source.get(key)
+                if value is not None:
+                    break
+            self._cache[cache_key] = value
 
-        logging.debug(f"Key {key} doesn't exist in arguments, config or CONFIG_DEFAULT")
+        if value is not None:
+            return value
+
+        logging.debug(f"Key {key} doesn't exist in arguments, config or default config")
         return default_value
 
     def set(self, key: str, value: Any) -> None:
-        """Updates config values and saves it to the file
+        """Updates config values and requests saving it to the file (in background)
 
         Args:
             key (str): config key
             value (Any): key's value
         """
         # Set value
-        self._config[key] = value
-
-        # Save to file
-        logging.debug(f"Saving config to {self._config_file}")
-        with open(self._config_file, "w+", encoding="utf-8") as config_file_io:
-            json.dump(self._config, config_file_io, indent=4, ensure_ascii=False)
+        with self._lock:
+            self._config[key] = value
+            self._changes_counter += 1
+        self._cache.pop((key, False), None)
+        self._cache.pop((key, True), None)
+
+        # Request saving
+        self._save_request.set()
+
+    def save(self) -> None:
+        """Saves config to the file (if there are any unsaved changes)
+        Writes into temp file first and then replaces config file with it to prevent partial writes
+        """
+        with self._lock:
+            if self._saved_counter == self._changes_counter:
+                return
+
+            logging.debug(f"Saving config to {self._config_file}")
+            config_file_temp = self._config_file + ".tmp"
+            try:
+                # Always written by json, because orjson doesn't support 4-space indentation
+                with open(config_file_temp, "w+", encoding="utf-8") as config_file_io:
+                    json.dump(self._config, config_file_io, indent=4, ensure_ascii=False)
+                os.replace(config_file_temp, self._config_file)
+                self._saved_counter = self._changes_counter
+            except Exception as e:
+                logging.error(f"Unable to save config to {self._config_file}: {e}")
+                logging.debug("Error details", exc_info=e)
+
+    def _saver_loop(self) -> None:
+        """Background thread that saves config on each request from set()"""
+        while True:
+            self._save_request.wait()
+            self._save_request.clear()
+            self.save()
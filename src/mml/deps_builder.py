@@ -20,7 +20,12 @@ import logging
 import os
 from typing import Callable
 
-from mml.artifact import Artifact
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from mml.artifact import VERIFIED_SUFFIX, Artifact, is_verified, verify_artifacts
 from mml.jdk_check_install import jdk_check_install
 from mml.resolve_artifact import resolve_artifact
 from mml.rules_check import os_name, rules_check
@@ -37,8 +42,8 @@ ASSET_OBJECTS_DIR = os.path.join(ASSETS_DIR, "objects")
 # Relative to game_dir
 ASSET_LEGACY_DIR = os.path.join(ASSETS_DIR, "virtual", "legacy")
 
-# Path to download objects from asset index
-ASSET_OBJECT_DOWNLOAD_URL = "https://resources.download.minecraft.net/{hash:.2}/{hash}"
+# Path to download objects from asset index (ASSET_OBJECT_DOWNLOAD_URL + hash[:2] + "/" + hash)
+ASSET_OBJECT_DOWNLOAD_URL = "https://resources.download.minecraft.net/"
 
 # Relative to game_dir
 LIBRARIES_DIR = "libraries"
@@ -57,16 +62,77 @@ JVM_ARGS_OLD = [
 ]
 
 
+def _load_asset_objects(asset_index_path: str) -> dict[str, dict]:
+    """Parses "objects" of asset index (using orjson if it's installed)
+
+    Args:
+        asset_index_path (str): path to asset index (.json)
+
+    Returns:
+        dict[str, dict]: {object_name: {"hash": "...", "size": ...}, ...}
+    """
+    if orjson is not None:
+        with open(asset_index_path, "rb") as asset_index_io:
+            return orjson.loads(asset_index_io.read()).get("objects", {})
+    with open(asset_index_path, "r", encoding="utf-8") as asset_index_io:
+        return json.load(asset_index_io).get("objects", {})
+
+
+def _scan_verified_objects(objects_root: str) -> dict[str, os.DirEntry]:
+    """Lists asset objects that have VERIFIED_SUFFIX file
+    Each shard directory is read once instead of checking every object separately.
+    Use is_verified() to check if object wasn't modified since verification
+
+    Args:
+        objects_root (str): path to assets/objects directory
+
+    Returns:
+        dict[str, os.DirEntry]: {object_hash: object's entry, ...}
+    """
+    verified_objects = {}
+    try:
+        shards = [entry.path for entry in os.scandir(objects_root) if entry.is_dir()]
+    except OSError:
+        return verified_objects
+
+    for shard in shards:
+        try:
+            entries = {entry.name: entry for entry in os.scandir(shard)}
+        except OSError:
+            continue
+        for name, entry in entries.items():
+            if name + VERIFIED_SUFFIX in entries:
+                verified_objects[name] = entry
+
+    return verified_objects
+
+
+def _scan_files(root: str) -> set[str]:
+    """Lists all files inside directory (recursively)
+    Each directory is read once instead of checking every file separately
+
+    Args:
+        root (str): path to directory
+
+    Returns:
+        set[str]: paths to files (joined with root)
+    """
+    files = set()
+    for dir_path, _, file_names in os.walk(root):
+        files.update(os.path.join(dir_path, file_name) for file_name in file_names)
+    return files
+
+
 class DepsBuilder:
     def __init__(
         self,
-        add_artifact: Callable[[Artifact], None],
+        add_artifacts: Callable[[list[Artifact]], None],
         game_dir: str,
         version_dir: str,
         version_id: str,
         version_json: dict,
     ):
-        self._add_artifact = add_artifact
+        self._add_artifacts = add_artifacts
         self._game_dir = game_dir
         self._version_dir = version_dir
         self._version_id = version_id
@@ -164,16 +230,14 @@ class DepsBuilder:
         if not asset_index_path:
             return None
 
-        # Parse it
-        with open(asset_index_path, "r", encoding="utf-8") as asset_index_io:
-            asset_index = json.load(asset_index_io)
-
         # map_to_resources = asset_index.get("map_to_resources", False)
         legacy_dir = os.path.join(self._game_dir, ASSET_LEGACY_DIR)
 
-        # Download all objects
-        objects_root = os.path.join(self._game_dir, ASSET_OBJECTS_DIR)
-        for object_name, object_data in asset_index.get("objects", {}).items():
+        # Different objects can have the same content, so group them by hash to download each file only once
+        # {object_hash: (size, [copy_to, ...]), ...}
+        objects_by_hash = {}
+        legacy_prefix = legacy_dir + os.sep
+        for object_name, object_data in _load_asset_objects(asset_index_path).items():
             object_hash = object_data.get("hash")
             if not object_hash:
                 continue
@@ -181,20 +245,49 @@ class DepsBuilder:
             # Copy to legacy dir
             # copy_to = None
             # if map_to_resources:
-            copy_to = os.path.normpath(os.path.join(legacy_dir, object_name))
+            copy_to = legacy_prefix + object_name.replace("/", os.sep)
 
-            # Build artifact and add it to the queue
+            if object_hash in objects_by_hash:
+                objects_by_hash[object_hash][1].append(copy_to)
+            else:
+                objects_by_hash[object_hash] = (object_data.get("size"), [copy_to])
+
+        # Download all objects starting from the largest ones so small objects fill the tail
+        objects_root = os.path.join(self._game_dir, ASSET_OBJECTS_DIR)
+        objects_sorted = sorted(objects_by_hash.items(), key=lambda item: item[1][0] or 0, reverse=True)
+        verified_objects = _scan_verified_objects(objects_root)
+        legacy_files = _scan_files(legacy_dir)
+        asset_artifacts = []
+        for object_hash, (object_size, copy_to) in objects_sorted:
+            # Skip objects that are already downloaded, verified (and not modified since that) and copied
+            object_entry = verified_objects.get(object_hash)
+            if object_entry is not None and all(copy_to_ in legacy_files for copy_to_ in copy_to):
+                try:
+                    object_stat = object_entry.stat()
+                except OSError:
+                    object_stat = None
+                if (
+                    object_stat is not None
+                    and object_stat.st_size == object_size
+                    and is_verified(object_entry.path, object_stat, [("sha1", object_hash)])
+                ):
+                    continue
+
+            # Build artifact
             asset_artifact = Artifact(
                 {
-                    "url": ASSET_OBJECT_DOWNLOAD_URL.format(hash=object_hash),
+                    "url": ASSET_OBJECT_DOWNLOAD_URL + object_hash[:2] + "/" + object_hash,
                     "sha1": object_hash,
-                    "size": object_data.get("size"),
+                    "size": object_size,
                 },
                 parent_dir=objects_root,
-                target_file=os.path.join(object_hash[:2], object_hash),
+                target_file=f"{object_hash[:2]}{os.sep}{object_hash}",
                 copy_to=copy_to,
             )
-            self._add_artifact(asset_artifact)
+            asset_artifacts.append(asset_artifact)
+
+        # Add all of them to the queue at once
+        self._add_artifacts(asset_artifacts)
 
         # Seems Ok
         return assets_id
@@ -214,6 +307,15 @@ class DepsBuilder:
         os_name_ = os_name()
 
         libs = []
+
+        # Merged (inherited) JSONs may list the same artifact multiple times, so download each one only once
+        # {(artifact_path, unpack_into), ...}
+        queued = set()
+
+        # Existing libraries are verified here (in parallel) and only invalid ones are added to the queue
+        existing_artifacts = []
+        queue_artifacts = []
+
         for library in self._version_json["libraries"]:
             if "name" not in library:
                 continue
@@ -236,7 +338,12 @@ class DepsBuilder:
             # Add main artifact to the final list and download queue
             if artifact_dict:
                 artifact_ = Artifact(artifact_dict, parent_dir=libs_dir)
-                self._add_artifact(artifact_)
+                if (artifact_.artifact_path, None) not in queued:
+                    queued.add((artifact_.artifact_path, None))
+                    if artifact_.artifact_exists:
+                        existing_artifacts.append(artifact_)
+                    else:
+                        queue_artifacts.append(artifact_)
                 libs.append(artifact_.path)
             else:
                 logging.debug("Skipping main artifact. Only natives required?")
@@ -253,7 +360,18 @@ class DepsBuilder:
                         exclude_files=library.get("extract", {}).get("exclude", []),
                     )
                     libs.append(native_artifact.path)
-                    self._add_artifact(native_artifact)
+                    if (native_artifact.artifact_path, natives_dir) not in queued:
+                        queued.add((native_artifact.artifact_path, natives_dir))
+                        queue_artifacts.append(native_artifact)
+
+        # Download existing libraries again only if their checksum is wrong
+        if existing_artifacts:
+            logging.debug(f"Verifying {len(existing_artifacts)} existing libraries")
+            for artifact_, valid in zip(existing_artifacts, verify_artifacts(existing_artifacts, os.cpu_count() or 1)):
+                if not valid:
+                    queue_artifacts.append(artifact_)
+
+        self._add_artifacts(queue_artifacts)
 
         return libs
 
@@ -19,29 +19,38 @@ import ctypes
 import gc
 import logging
 import multiprocessing
+import multiprocessing.connection
+import queue
 import threading
 import time
 
 from mml.artifact import Artifact
 from mml.resolver_process import resolver_process
 
-# To prevent overloading and smooth queue handling
+# How often to check if queue is empty while workers are running
 LOOP_DELAY = 0.25
 
+# Workers that don't exit within this time after stop() are terminated
+STOP_WAIT_TIMEOUT = 10.0
+
+# Max number of artifacts in a single queue item (see add_artifacts())
+BATCH_SIZE = 32
+
+# Units for sizeof_fmt()
+SIZE_UNITS = ("", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi", "Yi")
+
 # Progress log interval
 STATS_INTERVAL = 1.0
 
 
-def sizeof_fmt(num, suffix="B") -> str:
+def sizeof_fmt(num: int, suffix="B") -> str:
     """Format number of bytes to human readable form
-    By Fred Cirera
+    Based on Fred Cirera's version
     <https://web.archive.org/web/20111010015624/http://blogmag.net/blog/read/38/Print_human_readable_file_size>
+    but picks unit by bit length of number instead of dividing it in a loop
     """
-    for unit in ("", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"):
-        if abs(num) < 1024.0:
-            return f"{num:3.1f}{unit}{suffix}"
-        num /= 1024.0
-    return f"{num:.1f}Yi{suffix}"
+    unit_index = min(max(abs(int(num)).bit_length() - 1, 0) // 10, len(SIZE_UNITS) - 1)
+    return f"{num / (1 << (unit_index * 10)):3.1f}{SIZE_UNITS[unit_index]}{suffix}"
 
 
 class FileResolver:
@@ -67,17 +76,24 @@ class FileResolver:
         self._clear_on_error = clear_on_error
 
         self._queue = multiprocessing.Queue(-1)
+
+        # Number of items in the queue. queue.empty() is not reliable because data is sent by background thread
+        self._items_pending = multiprocessing.Value(ctypes.c_uint64, 0)
         self._bytes_total = 0
 
-        self._stop_flag = multiprocessing.Value(ctypes.c_bool, False)
-        self._error_flag = multiprocessing.Value(ctypes.c_bool, False)
+        self._stop_flag = multiprocessing.Event()
+        self._error_flag = multiprocessing.Event()
         self._bytes_processed = multiprocessing.Value(ctypes.c_uint64, 0)
 
         # Start background loop
-        self._workers = []
+        self._workers: dict[int, multiprocessing.Process] = {}
         self._checker_loop_running = True
         self._finished = True
+        self._finished_event = threading.Event()
+        self._finished_event.set()
+        self._finished_lock = threading.Lock()
         self._stats_timer = time.time()
+        self._wake = threading.Event()
         logging.debug("Starting _checker_loop()")
         self._checker_thread = threading.Thread(target=self._checker_loop, daemon=True)
         self._checker_thread.start()
@@ -88,20 +104,53 @@ class FileResolver:
         Returns:
             bool: True if nothing to process
         """
-        if not self._queue.empty():
+        if not self._queue_empty():
             return False
         return self._finished
 
+    def wait_finished(self, timeout: float | None = None) -> bool:
+        """Blocks until there is nothing to process (see finished)
+
+        Args:
+            timeout (float | None, optional): max time to wait in seconds. Defaults to None (wait forever)
+
+        Returns:
+            bool: True if finished or False in case of timeout
+        """
+        return self._finished_event.wait(timeout=timeout)
+
     def add_artifact(self, artifact_: Artifact) -> None:
         """Adds artifact to the queue and number of total bytes
         Args:
             artifact_ (Artifact): artifact to process
         """
         logging.debug(f"Adding artifact {artifact_} to the queue. Size: {artifact_.size}")
-        self._bytes_total += artifact_.size
-        self._queue.put(artifact_)
+        with self._finished_lock:
+            self._bytes_total += artifact_.size
+            self._finished_event.clear()
+            self._put(artifact_)
+        self._wake.set()
 
-        logging.debug("_checker_loop() stopped")
+    def add_artifacts(self, artifacts: list[Artifact]) -> None:
+        """Adds multiple artifacts to the queue by batches (each batch is pickled and sent at once)
+        Artifacts are distributed between batches in turn, so first artifacts (ex. the largest ones)
+        are processed by different workers
+
+        Args:
+            artifacts (list[Artifact]): artifacts to process
+        """
+        if not artifacts:
+            return
+        logging.debug(f"Adding {len(artifacts)} artifacts to the queue")
+        bytes_total = sum(artifact_.size for artifact_ in artifacts)
+        # At least one batch per worker, so all of them have something to do
+        batches_num = min(len(artifacts), max(-(-len(artifacts) // BATCH_SIZE), self._workers_num))
+        with self._finished_lock:
+            self._bytes_total += bytes_total
+            self._finished_event.clear()
+            for i in range(batches_num):
+                self._put(artifacts[i::batches_num])
+        self._wake.set()
 
     @property
     def error(self) -> bool:
@@ -109,14 +158,11 @@ class FileResolver:
         Returns:
             bool: True in case of error occurred while processing files
         """
-        with self._error_flag.get_lock():
-            error_flag_ = self._error_flag.value
-        return error_flag_
+        return self._error_flag.is_set()
 
     def clear_error(self) -> None:
         """Clears error flag"""
-        with self._error_flag.get_lock():
-            self._error_flag.value = False
+        self._error_flag.clear()
 
     @property
     def bytes_total(self) -> int:
@@ -132,9 +178,8 @@ class FileResolver:
         Returns:
             int: number of bytes already processed (approx.)
         """
-        with self._bytes_processed.get_lock():
-            bytes_processed_ = self._bytes_processed.value
-        return bytes_processed_
+        # Aligned 8-byte read is atomic, lock is only needed by writers
+        return self._bytes_processed.value
 
     def reset_bytes(self) -> None:
         """Resets bytes_total and bytes_processed"""
@@ -147,8 +192,7 @@ class FileResolver:
         Returns:
             float: processing progress in [0-1] range
         """
-        with self._bytes_processed.get_lock():
-            bytes_processed_ = self._bytes_processed.value
+        bytes_processed_ = self._bytes_processed.value
         if self._bytes_total != 0 and bytes_processed_ <= self._bytes_total:
             return bytes_processed_ / self._bytes_total
         return 0.0 if self._bytes_total == 0 else 1.0
@@ -157,8 +201,21 @@ class FileResolver:
         """Clears queue, bytes_total, bytes_processed and calls garbage collector
         NOTE: Doesn't clear error flag! You must clear it manually
         """
-        while not self._queue.empty():
-            self._queue.get()
+        with self._items_pending.get_lock():
+            while self._items_pending.value != 0:
+                try:
+                    self._queue.get(timeout=LOOP_DELAY)
+                except queue.Empty:
+                    break
+                self._items_pending.value -= 1
+            self._items_pending.value = 0
+
+            # Take everything that is left (if counter is out of sync) without empty() checks
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
 
         self.reset_bytes()
         gc.collect()
@@ -173,32 +230,87 @@ class FileResolver:
         logging.info("Stopping file resolver")
 
         # Request stop
-        with self._stop_flag.get_lock():
-            if not self._stop_flag.value:
-                self._stop_flag.value = True
+        self._stop_flag.set()
 
-        # Wait for processes to finish gracefully
+        # Wait for processes to finish gracefully. Workers check stop flag between artifacts,
+        # so they exit as soon as they finish current one
         if len(self._workers) != 0:
             logging.debug("Waiting for workers to finish")
+        terminated = False
+        stop_deadline = time.time() + STOP_WAIT_TIMEOUT
         while len(self._workers) != 0:
-            for worker in self._workers:
-                if worker is None or not worker.is_alive():
-                    logging.debug(f"Worker {worker} is dead now. Removing it")
-                    del self._workers[self._workers.index(worker)]
-            time.sleep(LOOP_DELAY)
+            timeout = stop_deadline - time.time()
+            if timeout > 0:
+                multiprocessing.connection.wait(
+                    [worker.sentinel for worker in list(self._workers.values())], timeout=timeout
+                )
+
+            # Workers are stuck (ex. on a slow download). Terminate them as the last resort
+            # NOTE: terminated worker may also leave logging queue locked, which can block other processes logging into
+            # it. That queue is owned by LoggingHandler, so it can't be replaced here
+            else:
+                for worker in list(self._workers.values()):
+                    logging.warning(f"Worker {worker} didn't stop in {STOP_WAIT_TIMEOUT:.0f}s. Terminating it")
+                    worker.terminate()
+                    worker.join()
+                terminated = True
+
+            self._remove_dead_workers()
 
         # Stop thread and wait for it to stop
         if stop_background_thread:
             self._checker_loop_running = False
+            self._wake.set()
             if self._checker_thread.is_alive():
                 logging.debug("Waiting for _checker_thread")
                 self._checker_thread.join()
 
+        # Terminated worker may have left queue or shared values broken (ex. with their lock held)
+        # so don't touch them and create new ones instead
+        if terminated:
+            with self._finished_lock:
+                # Don't wait for old queue's feeder thread to flush data on exit
+                self._queue.cancel_join_thread()
+                self._queue.close()
+                self._queue = multiprocessing.Queue(-1)
+                self._items_pending = multiprocessing.Value(ctypes.c_uint64, 0)
+                self._bytes_processed = multiprocessing.Value(ctypes.c_uint64, 0)
+                self._bytes_total = 0
+            gc.collect()
+
         # Clear everything
-        self.clear()
+        else:
+            self.clear()
 
         logging.info("File resolver stopped")
 
+    def _remove_dead_workers(self) -> None:
+        """Removes exited processes from self._workers"""
+        for pid, worker in list(self._workers.items()):
+            if not worker.is_alive():
+                logging.debug(f"Worker {worker} is dead now. Removing it")
+                worker.join()
+                self._workers.pop(pid, None)
+
+    def _put(self, item: Artifact | list[Artifact]) -> None:
+        """Puts item into the queue and increments number of pending items
+
+        Args:
+            item (Artifact | list[Artifact]): artifact or batch of artifacts
+        """
+        with self._items_pending.get_lock():
+            self._items_pending.value += 1
+        self._queue.put(item)
+
+    def _queue_empty(self) -> bool:
+        """
+        Returns:
+            bool: True if all items were taken from the queue by workers
+        """
+        with self._items_pending.get_lock():
+            items_pending_ = self._items_pending.value
+        return items_pending_ == 0
+
     def _stats_cli(self) -> None:
         """Prints resolver stats each STATS_INTERVAL"""
         if time.time() - self._stats_timer >= STATS_INTERVAL:
@@ -214,29 +326,22 @@ class FileResolver:
         cleared = True
         while self._checker_loop_running:
             # Check workers and remove exited ones
-            for worker in self._workers:
-                if worker is None or not worker.is_alive():
-                    logging.debug(f"Worker {worker} is dead now. Removing it")
-                    del self._workers[self._workers.index(worker)]
+            self._remove_dead_workers()
 
             # Check for errors
-            with self._error_flag.get_lock():
-                error_flag_ = self._error_flag.value
+            error_flag_ = self._error_flag.is_set()
 
             # Stop all workers in case of error or if nothing to process
-            if error_flag_ or (self._queue.empty() and len(self._workers) != 0):
-                with self._stop_flag.get_lock():
-                    if not self._stop_flag.value:
-                        logging.debug("Stopping workers")
-                        self._stop_flag.value = True
+            if error_flag_ or (self._queue_empty() and len(self._workers) != 0):
+                if not self._stop_flag.is_set():
+                    logging.debug("Stopping workers")
+                    self._stop_flag.set()
 
             # Start workers if we have data to process and no errors
-            if not error_flag_ and not self._queue.empty() and len(self._workers) == 0:
+            if not error_flag_ and not self._queue_empty() and len(self._workers) == 0:
                 cleared = False
                 self._finished = False
-                with self._stop_flag.get_lock():
-                    if self._stop_flag.value:
-                        self._stop_flag.value = False
+                self._stop_flag.clear()
                 for i in range(self._workers_num):
                     logging.debug(f"Starting worker {i + 1}")
                     worker = multiprocessing.Process(
@@ -244,19 +349,22 @@ class FileResolver:
                         args=(
                             i + 1,
                             self._queue,
+                            self._items_pending,
                             self._stop_flag,
                             self._error_flag,
                             self._bytes_processed,
                             self._logging_queue,
+                            logging.getLogger().getEffectiveLevel(),
                         ),
                     )
                     worker.start()
-                    self._workers.append(worker)
-                    time.sleep(0.1)
+                    self._workers[worker.pid] = worker
 
             # Resolving considered finished only after all process are finished
-            if len(self._workers) == 0 and self._queue.empty():
-                self._finished = True
+            with self._finished_lock:
+                if len(self._workers) == 0 and self._queue_empty():
+                    self._finished = True
+                    self._finished_event.set()
 
             # Clear queue, error flag and stats
             if (
@@ -264,12 +372,23 @@ class FileResolver:
                 and len(self._workers) == 0
                 and (self._clear_on_error and error_flag_ or self._clear_on_finish and not error_flag_)
             ):
-                self.clear()
-                cleared = True
+                # Don't drain artifacts that were added after finished check
+                with self._finished_lock:
+                    if error_flag_ or self._queue_empty():
+                        self.clear()
+                        cleared = True
 
             # Print progress
             if len(self._workers) != 0 and self._bytes_total != 0:
                 self._stats_cli()
 
-            # Sleep a bit to prevent overloading
-            time.sleep(LOOP_DELAY)
+            # Wait for any worker to exit (or for queue to become empty) while resolving
+            if len(self._workers) != 0:
+                multiprocessing.connection.wait(
+                    [worker.sentinel for worker in list(self._workers.values())], timeout=LOOP_DELAY
+                )
+
+            # Otherwise sleep until new artifact is added
+            else:
+                self._wake.wait(timeout=STATS_INTERVAL)
+                self._wake.clear()
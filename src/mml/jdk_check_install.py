@@ -15,7 +15,6 @@ You should have received a copy of the GNU General Public License along with thi
 If not, see <http://www.gnu.org/licenses/>.
 """
 
-import glob
 import logging
 import os
 import re
@@ -28,8 +27,23 @@ from mml.rules_check import os_name
 # Main subdir
 JDK_PATH = "jdk"
 
-# Relative to JDK_PATH
-JAVA_PATH = os.path.join("jdk*", "bin", "java.exe" if os_name() == "windows" else "java")
+# Relative to JDK_PATH/jdk*
+JAVA_PATH = os.path.join("bin", "java.exe" if os_name() == "windows" else "java")
+
+# Java classpath separator (OS can't change at runtime)
+CLASSPATH_SEPARATOR = ";" if os_name() == "windows" else ":"
+
+# Relative to JDK / JRE root directory. Stores major version from java -version
+VERSION_MARKER = ".mml_major"
+
+# Max time to wait for java -version (in seconds)
+JAVA_VERSION_TIMEOUT = 10
+
+# Version from java -version output. Ex.: openjdk version "17.0.9" 2023-10-17 or java version "1.8.0_392"
+JAVA_VERSION_RE = re.compile(r'version "(\d+)(?:\.(\d+))?')
+
+# Version from "release" file in JDK / JRE root directory. Ex.: JAVA_VERSION="17.0.9" or JAVA_VERSION="1.8.0_392"
+RELEASE_VERSION_RE = re.compile(r'^JAVA_VERSION="(?:1\.)?(\d+)', re.MULTILINE)
 
 
 def classpath_separator() -> str:
@@ -37,10 +51,7 @@ def classpath_separator() -> str:
     Returns:
         str: Java classpath separator
     """
-    if os_name() == "windows":
-        return ";"
-    else:
-        return ":"
+    return CLASSPATH_SEPARATOR
 
 
 def jdk_check_install(version: int = 17) -> str | None:
@@ -60,14 +71,13 @@ def jdk_check_install(version: int = 17) -> str | None:
         logging.info(f"Creating {jdk_path_abs} directory")
         os.makedirs(jdk_path_abs)
 
-    java_final_path = os.path.join(jdk_path_abs, JAVA_PATH)
-    java_paths = glob.glob(java_final_path)
+    java_paths = _find_java_paths(jdk_path_abs)
 
     logging.debug(f"Found java executables: {'; '.join(java_paths)}")
 
     # Check if we need to download
     for java_path in java_paths:
-        java_version = _parse_major_version(java_path)
+        java_version = _major_version(java_path)
         if java_version == version:
             logging.info(f"Java path: {java_path}")
             return java_path
@@ -82,9 +92,9 @@ def jdk_check_install(version: int = 17) -> str | None:
         jdk.install(version=str(version), jre=False, path=jdk_path_abs)
 
     # Check again
-    java_paths = glob.glob(java_final_path)
+    java_paths = _find_java_paths(jdk_path_abs)
     for java_path in java_paths:
-        if _parse_major_version(java_path) == version:
+        if _major_version(java_path) == version:
             logging.info(f"Java path: {java_path}")
             return java_path
 
@@ -92,44 +102,112 @@ def jdk_check_install(version: int = 17) -> str | None:
     return None
 
 
-def _parse_major_version(java_bin: str) -> int | None:
-    """Parses major java version by running java -version
+def _find_java_paths(jdk_path_abs: str) -> list[str]:
+    """Lists java executables inside jdk* directories
 
     Args:
-        java_bin (str): path to java executable
+        jdk_path_abs (str): absolute path to JDK_PATH
+
+    Returns:
+        list[str]: paths to existing java executables
+    """
+    try:
+        with os.scandir(jdk_path_abs) as entries:
+            jdk_roots = sorted(entry.path for entry in entries if entry.name.startswith("jdk") and entry.is_dir())
+    except FileNotFoundError:
+        return []
+    java_paths = [os.path.join(jdk_root, JAVA_PATH) for jdk_root in jdk_roots]
+    return [java_path for java_path in java_paths if os.path.isfile(java_path)]
+
+
+def _major_version(java_bin: str) -> int | None:
+    """Determines major java version from "release" file, from VERSION_MARKER file
+    or by running java -version if there are no such files
+
+    Args:
+        java_bin (str): path to java executable (jdk_root/bin/java)
 
     Returns:
         int: major version or -1 in case of error
     """
-    cmd = [java_bin, "-version"]
-    logging.debug(f"Running {' '.join(cmd)}")
-    java_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)
+    jdk_root = os.path.dirname(os.path.dirname(java_bin))
+    java_version = _parse_major_version_from_release(jdk_root)
+    if java_version is not None:
+        return java_version
 
-    out, err = java_process.communicate()
-    out = out.decode("utf-8", errors="replace").strip()
-    err = err.decode("utf-8", errors="replace").strip()
+    # Version from previous java -version call
+    version_marker = os.path.join(jdk_root, VERSION_MARKER)
+    try:
+        with open(version_marker, "r", encoding="utf-8") as version_marker_io:
+            return int(version_marker_io.read().strip())
+    except (OSError, ValueError):
+        pass
 
-    version_out = (out + err).split(" ")
-    for version_word in version_out:
-        version_word = version_word.strip()
-        if not version_word:
-            continue
+    java_version = _parse_major_version(java_bin)
 
+    # Save it to not start JVM next time
+    if java_version != -1:
         try:
-            version = re.search("[0-9]+\\.[0-9]+\\..*", version_word).group(0)
-        except (AttributeError, IndexError):
-            continue
-        if not version:
-            continue
+            with open(version_marker, "w+", encoding="utf-8") as version_marker_io:
+                version_marker_io.write(str(java_version))
+        except OSError as e:
+            logging.debug(f"Unable to write {version_marker}: {e}")
+
+    return java_version
 
-        logging.debug(f"Raw java version: {version}")
 
-        if version.startswith("1.8"):
-            version = 8
-        else:
-            version = int(version.split(".")[0])
+def _parse_major_version_from_release(jdk_root: str) -> int | None:
+    """Parses major java version from "release" file without starting JVM
 
-        logging.debug(f"Found java version: {version}")
-        return version
+    Args:
+        jdk_root (str): path to JDK / JRE root directory
+
+    Returns:
+        int | None: major version or None if there is no "release" file or no version in it
+    """
+    try:
+        with open(os.path.join(jdk_root, "release"), "r", encoding="utf-8", errors="replace") as release_io:
+            version_match = RELEASE_VERSION_RE.search(release_io.read())
+    except OSError:
+        return None
+    if version_match is None:
+        return None
+
+    logging.debug(f"Found java version in {jdk_root}: {version_match.group(1)}")
+    return int(version_match.group(1))
+
+
+def _parse_major_version(java_bin: str) -> int:
+    """Parses major java version by running java -version
+
+    Args:
+        java_bin (str): path to java executable
+
+    Returns:
+        int: major version or -1 in case of error
+    """
+    cmd = [java_bin, "-version"]
+    logging.debug(f"Running {' '.join(cmd)}")
+    try:
+        java_process = subprocess.run(cmd, capture_output=True, timeout=JAVA_VERSION_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logging.warning(f"Unable to get version of {java_bin}: {e}")
+        return -1
+
+    # java -version writes to stderr
+    version_match = JAVA_VERSION_RE.search(java_process.stderr.decode("utf-8", errors="replace"))
+    if version_match is None:
+        version_match = JAVA_VERSION_RE.search(java_process.stdout.decode("utf-8", errors="replace"))
+    if version_match is None:
+        return -1
+
+    logging.debug(f"Raw java version: {version_match.group(0)}")
+
+    # 1.8 -> 8
+    if version_match.group(1) == "1" and version_match.group(2):
+        version = int(version_match.group(2))
+    else:
+        version = int(version_match.group(1))
 
-    return -1
+    logging.debug(f"Found java version: {version}")
+    return version
@@ -16,16 +16,15 @@ If not, see <http://www.gnu.org/licenses/>.
 """
 
 import hashlib
+import itertools
 import logging
 import os
-import queue
 import re
 import subprocess
 import sys
-import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from enum import IntEnum
-from functools import reduce
-from threading import Thread
+from threading import Event, Thread, Timer
 
 from mml._version import LAUNCHER_VERSION
 from mml.deps_builder import DepsBuilder
@@ -41,11 +40,33 @@ MAIN_CLASS_DEFAULT = "net.minecraft.launchwrapper.Launch"
 
 # To replace <XMLLayout /> and <LegacyXMLLayout />
 LOG_CONFIG_LAYOUT = '<PatternLayout pattern="[%t/%level]: %msg{nolookups}%n" />'
+XML_LAYOUT_RE = re.compile("<(?:Legacy)?XMLLayout />")
 
 # How long to wait for minecraft process to stops by itself after MINECRAFT_STOPPING_LOG before killing it
 MINECRAFT_STOPPING_LOG = "(\\[Render thread\\/INFO\\]\\: Stopping\\!|\\!\\[CDATA\\[Stopping\\!\\]\\])"
+MINECRAFT_STOPPING_RE = re.compile(MINECRAFT_STOPPING_LOG)
 MINECRAFT_STOPPING_TIMEOUT = 3.0
 
+# Log level by substring of minecraft's log line. The first found is used
+LOG_LEVEL_TAGS = ((b"ERROR", logging.error), (b"WARN", logging.warning), (b"INFO", logging.info))
+
+# Environment variable placeholder in arguments. Ex.: ${natives_directory}
+PLACEHOLDER_RE = re.compile("\\$\\{[^\\$\\}\\{]+\\}")
+
+# JVM arguments for --fast-start: C1 compiler only and class data sharing (ignored by JVMs that don't support them)
+FAST_START_JVM_ARGS = [
+    "-XX:+IgnoreUnrecognizedVMOptions",
+    "-XX:+TieredCompilation",
+    "-XX:TieredStopAtLevel=1",
+    "-Xshare:auto",
+]
+
+# AppCDS archive of loaded classes for --fast-start (relative to versions/version_id). Created on the first launch
+APPCDS_ARCHIVE = "appcds.jsa"
+
+# Buffer size of minecraft's STDOUT reader. Bursts of log lines are read by a few large read() calls
+STDOUT_BUFFER_SIZE = 64 * 1024
+
 ON_POSIX = "posix" in sys.builtin_module_names
 
 
@@ -79,6 +100,7 @@ class Launcher(Thread):
         java_path: str | None = None,
         extra_jvm_args: list[str] | None = None,
         extra_game_args: list[str] | None = None,
+        fast_start: bool = False,
     ) -> None:
         Thread.__init__(self)
         self._file_resolver = file_resolver_
@@ -94,12 +116,15 @@ class Launcher(Thread):
         self._java_path = java_path
         self._extra_jvm_args = extra_jvm_args
         self._extra_game_args = extra_game_args
+        self._fast_start = fast_start
 
         if self._features is None:
             self._features = {}
 
         self._state = State.IDLE
         self._minecraft_process = None
+        self._stop_event = Event()
+        self._finished_event = Event()
 
     @property
     def state(self) -> State:
@@ -109,12 +134,31 @@ class Launcher(Thread):
         """
         return self._state
 
+    def wait_finished(self, timeout: float | None = None) -> bool:
+        """Blocks until launcher thread finishes (minecraft exited, launch failed or canceled)
+
+        Args:
+            timeout (float | None, optional): max time to wait in seconds. Defaults to None (wait forever)
+
+        Returns:
+            bool: True if finished or False in case of timeout
+        """
+        return self._finished_event.wait(timeout=timeout)
+
     def run(self) -> None:
+        self._finished_event.clear()
+        try:
+            self._run()
+        finally:
+            self._finished_event.set()
+
+    def _run(self) -> None:
         if self._state != State.IDLE and self._state != State.ERROR:
             logging.error("Unable to launch. Already running?")
             return
 
         self._state = State.PREPARING
+        self._stop_event.clear()
 
         # Parse versions if not parsed yet
         if not self._profile_parser.versions_info:
@@ -124,12 +168,12 @@ class Launcher(Thread):
             # Get or download profile's JSON
             version_path = self._profile_parser.version_path_by_id(self._version_id, download=True)
             if not version_path:
-                logging.error(f"Unable to load version {self._version_id}")
+                logging.error("Unable to load version %s", self._version_id)
                 self._state = State.ERROR
                 return
             version_json = self._profile_parser.parse_version_json(version_path)
             if not version_json:
-                logging.error(f"Unable to load version {self._version_id}")
+                logging.error("Unable to load version %s", self._version_id)
                 self._state = State.ERROR
                 return
 
@@ -146,61 +190,88 @@ class Launcher(Thread):
 
             # Create dependency builder instance
             deps_builder_ = DepsBuilder(
-                self._file_resolver.add_artifact,
+                self._file_resolver.add_artifacts,
                 self._profile_parser.game_dir,
                 self._profile_parser.versions_dir,
                 self._version_id,
                 version_json,
             )
 
-            # Download Java
-            self._state = State.JAVA
-            if not self._java_path or not os.path.exists(self._java_path):
-                self._java_path = deps_builder_.get_java()
-                if not self._java_path:
-                    raise Exception("Unable to get Java")
-                logging.debug("get_java() done")
-
-            # Download client
-            self._state = State.CLIENT
-            client_jar = deps_builder_.get_client()
-            if not client_jar:
-                raise Exception("Unable to get client")
-            logging.debug("get_client() done")
-
-            # Resolve assets
-            self._state = State.ASSETS
-            asset_index = deps_builder_.get_assets()
-            if not asset_index:
-                raise Exception("Unable to get assets")
-            logging.debug("get_assets() done")
-
-            # Resolve libraries and natives
-            self._state = State.LIBRARIES
-            libs = deps_builder_.get_libraries()
-            if libs is None:
-                raise Exception("Unable to get libraries")
-            logging.debug("get_libraries() done")
-
-            self._state = State.LOG_CONFIG
-            log_config_path, log_config_arg = deps_builder_.get_log_config()
-            logging.debug("get_log_config() done")
+            # Java, client, log config and libraries with assets don't depend on each other, so resolve them in parallel
+            # Libraries are resolved before assets, so large files are downloaded first
+            cancel_assets = Event()
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                java_future = None
+                if not self._java_path or not os.path.exists(self._java_path):
+                    java_future = executor.submit(deps_builder_.get_java)
+                client_future = executor.submit(deps_builder_.get_client)
+                log_config_future = executor.submit(deps_builder_.get_log_config)
+                libs_future = executor.submit(deps_builder_.get_libraries)
+                assets_future = executor.submit(self._get_assets, deps_builder_, libs_future, cancel_assets)
+
+                try:
+                    # Download Java
+                    self._state = State.JAVA
+                    if java_future is not None:
+                        self._java_path = java_future.result()
+                        if not self._java_path:
+                            raise Exception("Unable to get Java")
+                        logging.debug("get_java() done")
+
+                    # Download client
+                    self._state = State.CLIENT
+                    client_jar = client_future.result()
+                    if not client_jar:
+                        raise Exception("Unable to get client")
+                    logging.debug("get_client() done")
+
+                    # Resolve libraries and natives
+                    self._state = State.LIBRARIES
+                    libs = libs_future.result()
+                    if libs is None:
+                        raise Exception("Unable to get libraries")
+                    logging.debug("get_libraries() done")
+
+                    # Resolve assets
+                    self._state = State.ASSETS
+                    asset_index = assets_future.result()
+                    if not asset_index:
+                        raise Exception("Unable to get assets")
+                    logging.debug("get_assets() done")
+
+                    self._state = State.LOG_CONFIG
+                    log_config_path, log_config_arg = log_config_future.result()
+                    logging.debug("get_log_config() done")
+
+                # Libraries (and maybe assets) are already queued -> don't download them in background
+                except Exception:
+                    cancel_assets.set()
+                    wait((libs_future, assets_future))
+                    self._file_resolver.stop()
+                    raise
 
             # Replace <LegacyXMLLayout /> to be able to read config from stdout without 3rd-party parser
             if log_config_path:
-                logging.info(f"Modifying log config: {log_config_path}")
+                logging.info("Checking log config: %s", log_config_path)
                 with open(log_config_path, "r", encoding="utf-8") as log_config_io:
                     log_config = log_config_io.read()
-                log_config = log_config.replace("<XMLLayout />", LOG_CONFIG_LAYOUT)
-                log_config = log_config.replace("<LegacyXMLLayout />", LOG_CONFIG_LAYOUT)
-                with open(log_config_path, "w+", encoding="utf-8") as log_config_io:
-                    log_config_io.write(log_config)
+                log_config_new = XML_LAYOUT_RE.sub(LOG_CONFIG_LAYOUT, log_config)
+
+                # Config is already modified on previous launches
+                if log_config_new != log_config:
+                    with open(log_config_path, "w+", encoding="utf-8") as log_config_io:
+                        log_config_io.write(log_config_new)
 
             # Wait for everything to resolve
             self._state = State.PROCESS_FILES
             logging.info("Waiting for file resolver to finish")
-            while not self._file_resolver.finished:
-                time.sleep(0.1)
+            self._file_resolver.wait_finished()
+
+            # File resolver finishes after stop() too -> don't launch minecraft
+            if self._stop_event.is_set():
+                logging.warning("Launch canceled")
+                self._state = State.IDLE
+                return
 
             # Check for error -> clear it and exit
             if self._file_resolver.error:
@@ -212,24 +283,26 @@ class Launcher(Thread):
             logging.info("File resolver finished successfully")
             self._state = State.PRELAUNCH
 
+            natives_dir = deps_builder_.natives_dir
+            libs_dir = deps_builder_.libs_dir
+
             # Create natives dir if not exists (just in case)
-            if not os.path.exists(deps_builder_.natives_dir):
-                logging.info(f"Creating {deps_builder_.natives_dir} directory")
-                os.makedirs(deps_builder_.natives_dir)
+            if not os.path.exists(natives_dir):
+                logging.info("Creating %s directory", natives_dir)
+                os.makedirs(natives_dir)
 
-            # Build classpath from client and all libraries
-            classpath = []
-            for lib in libs:
-                classpath.append(os.path.join(deps_builder_.libs_dir, lib))
-            classpath.append(client_jar)
+            # Build classpath from all libraries and client (libraries paths are relative to libs_dir)
+            libs_dir_prefix = libs_dir + os.sep
+            classpath_separator_ = classpath_separator()
+            classpath = classpath_separator_.join([*(libs_dir_prefix + lib for lib in libs), client_jar])
 
             # Build environment variables
             env_variables_ = {
                 "game_directory": cwd,
-                "library_directory": deps_builder_.libs_dir,
-                "natives_directory": deps_builder_.natives_dir,
-                "classpath_separator": classpath_separator(),
-                "classpath": classpath_separator().join(classpath),
+                "library_directory": libs_dir,
+                "natives_directory": natives_dir,
+                "classpath_separator": classpath_separator_,
+                "classpath": classpath,
                 "game_assets": deps_builder_.assets_legacy_dir,
                 "assets_root": deps_builder_.assets_dir,
                 "assets_index_name": asset_index,
@@ -248,7 +321,10 @@ class Launcher(Thread):
 
             # Username provided, but UUID not -> generate offline one
             elif not self._auth_uuid:
-                auth_uuid = bytearray(hashlib.md5(f"OfflinePlayer:{self._user_name}".encode("utf-8")).digest())
+                # MD5 is used only to derive UUID (not for security), so it works on FIPS-enabled systems too
+                auth_uuid = bytearray(
+                    hashlib.md5(b"OfflinePlayer:" + self._user_name.encode("utf-8"), usedforsecurity=False).digest()
+                )
                 auth_uuid[6] = auth_uuid[6] & 0x0F | 0x30
                 auth_uuid[8] = auth_uuid[8] & 0x3F | 0x80
                 # self._auth_uuid = str(UUID(bytes=bytes(auth_uuid)))
@@ -266,60 +342,51 @@ class Launcher(Thread):
             if "user_properties" not in env_variables_:
                 env_variables_["user_properties"] = "{}"
 
-            # Add java args
-            final_cmd = [self._java_path]
-            final_cmd.extend(deps_builder_.get_arguments(False, self._features))
-            if self._extra_jvm_args:
-                final_cmd.extend(self._extra_jvm_args)
-
-            # Log config
-            if log_config_arg:
-                final_cmd.append(log_config_arg)
-
-            # Main class
-            main_class = version_json.get("mainClass", MAIN_CLASS_DEFAULT)
-            final_cmd.append(main_class)
+            # Java, JVM args, log config, main class and game (minecraft) args
+            final_cmd = list(
+                itertools.chain(
+                    (self._java_path,),
+                    deps_builder_.get_arguments(False, self._features),
+                    self._fast_start_args() if self._fast_start else (),
+                    self._extra_jvm_args or (),
+                    (log_config_arg,) if log_config_arg else (),
+                    (version_json.get("mainClass", MAIN_CLASS_DEFAULT),),
+                    deps_builder_.get_arguments(True, self._features),
+                    self._extra_game_args or (),
+                )
+            )
 
-            # Add game (minecraft) args
-            final_cmd.extend(deps_builder_.get_arguments(True, self._features))
-            if self._extra_game_args:
-                final_cmd.extend(self._extra_game_args)
-
-            # Replace env placeholders in arguments
-            for i, argument in enumerate(final_cmd):
-                # Search for placeholders
-                try:
-                    match_ = re.findall("\\$\\{[^\\$\\}\\{]+\\}", argument)
-                except (AttributeError, IndexError):
-                    continue
-
-                # Remove duplicates
-                unique_placeholders = reduce(lambda re, x: re + [x] if x not in re else re, match_, [])
-
-                # Replace
-                for placeholder in unique_placeholders:
-                    env_variable_name = placeholder[2:-1]
-
-                    # Try to get from env_variables or from os.environ
-                    if env_variable_name in env_variables_:
-                        env_value = env_variables_.get(env_variable_name)
-                    else:
-                        env_value = os.environ.get(env_variable_name)
-                    if not env_value:
-                        env_value = ""
-                        logging.warning(f"No environment variable {env_variable_name}")
-
-                    # Replace
-                    final_cmd[i] = final_cmd[i].replace(placeholder, env_value)
-
-            # Clone environ and replace
-            environ_copy = os.environ.copy()
-            for var_name, var_value in env_variables_.items():
-                environ_copy[var_name] = var_value
-            logging.debug(f"Environment: {environ_copy}")
-
-            # Log final command
-            logging.info(f"Full command: {' '.join(final_cmd)}")
+            def _placeholder_value(match_: re.Match) -> str:
+                env_variable_name = match_.group(0)[2:-1]
+
+                # Try to get from env_variables or from os.environ
+                if env_variable_name in env_variables_:
+                    env_value = env_variables_.get(env_variable_name)
+                else:
+                    env_value = os.environ.get(env_variable_name)
+                if not env_value:
+                    env_value = ""
+                    logging.warning("No environment variable %s", env_variable_name)
+                return env_value
+
+            # Replace env placeholders in arguments in a single pass (skip arguments without placeholders)
+            final_cmd = [
+                (
+                    PLACEHOLDER_RE.sub(_placeholder_value, argument)
+                    if isinstance(argument, str) and "${" in argument
+                    else argument
+                )
+                for argument in final_cmd
+            ]
+
+            # Clone environ and replace (in one pass)
+            environ_copy = {**os.environ, **env_variables_}
+            logging.debug("Environment: %s", environ_copy)
+
+            # Log final command (full command only in debug mode, because classpath can be huge)
+            logging.info("Launching minecraft with %d arguments", len(final_cmd))
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Full command: %s", " ".join(final_cmd))
 
             # Finally, start minecraft's process
             self._state = State.MINECRAFT
@@ -327,46 +394,44 @@ class Launcher(Thread):
                 final_cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
+                bufsize=STDOUT_BUFFER_SIZE,
                 close_fds=ON_POSIX,
                 shell=False,
                 cwd=cwd,
                 env=environ_copy,
             )
 
-            stdout_queue = queue.Queue()
-            stdout_thread = Thread(target=self._enqueue_output, args=(stdout_queue,), daemon=True)
-            stdout_thread.start()
+            # stop() was called while starting the process
+            if self._stop_event.is_set():
+                self._minecraft_process.kill()
 
-            stopping_timer = 0
+            stopping_timer = None
             level = logging.info
 
-            # Capture logs
-            while self._minecraft_process.poll() is None:
-                # Read logs from STOUT (non-blocking way)
-                try:
-                    minecraft_stdout = stdout_queue.get(block=False)
-                except queue.Empty:
-                    time.sleep(0.1)
-                    self._check_kill(stopping_timer)
-                    continue
+            # Capture logs. Iteration blocks until the next line and stops after minecraft closes STDOUT
+            for minecraft_stdout in self._minecraft_process.stdout:
+                # Try to guess log level (lines without level, ex. stack traces, keep the previous one)
+                for level_tag, level_ in LOG_LEVEL_TAGS:
+                    if level_tag in minecraft_stdout:
+                        level = level_
+                        break
 
                 log_line = minecraft_stdout.decode("utf-8", errors="replace").strip()
 
-                # Try to guess log level
-                if "INFO" in log_line:
-                    level = logging.info
-                if "WARN" in log_line:
-                    level = logging.warning
-                elif "ERROR" in log_line:
-                    level = logging.error
-
                 # Redirect log
-                level(f"[Minecraft] {log_line}")
+                level("[Minecraft] %s", log_line)
 
-                # Start timer if there is MINECRAFT_STOPPING_LOG message
-                if re.search(MINECRAFT_STOPPING_LOG, log_line):
-                    logging.info(f"Stopping message found! Minecraft must exit in {MINECRAFT_STOPPING_TIMEOUT}s")
-                    stopping_timer = time.time()
+                # Start timer if there is MINECRAFT_STOPPING_LOG message (cheap substring check first)
+                if stopping_timer is None and "Stopping!" in log_line and MINECRAFT_STOPPING_RE.search(log_line):
+                    logging.info("Stopping message found! Minecraft must exit in %.1fs", MINECRAFT_STOPPING_TIMEOUT)
+                    stopping_timer = Timer(MINECRAFT_STOPPING_TIMEOUT, self._kill_stuck)
+                    stopping_timer.daemon = True
+                    stopping_timer.start()
+
+            self._minecraft_process.stdout.close()
+            self._minecraft_process.wait()
+            if stopping_timer is not None:
+                stopping_timer.cancel()
 
             # Minecraft closed
             logging.info("Minecraft process stopped")
@@ -374,7 +439,7 @@ class Launcher(Thread):
 
         except Exception as e:
             self._state = State.ERROR
-            logging.error(f"Error launching minecraft: {e}", exc_info=e)
+            logging.error("Error launching minecraft: %s", e, exc_info=e)
 
     def stop(self) -> None:
         """Stops any downloads (file resolvers), minecraft and waits for the launcher thread to stop"""
@@ -382,6 +447,9 @@ class Launcher(Thread):
             logging.debug("Nothing to stop")
             return
 
+        # Prevent launcher thread from starting minecraft
+        self._stop_event.set()
+
         # Stop file resolver
         if not self._file_resolver.finished:
             self._file_resolver.stop()
@@ -407,21 +475,34 @@ class Launcher(Thread):
 
         logging.info("Launcher thread stopped")
 
-    def _enqueue_output(self, queue_: queue.Queue) -> None:
-        """Handler for reading lines from minecraft's STDOUT and putting them into queue_"""
-        logging.debug("_enqueue_output() started")
-        for line in iter(self._minecraft_process.stdout.readline, b""):
-            queue_.put(line)
-        self._minecraft_process.stdout.close()
-        logging.debug("_enqueue_output() finished")
+    def _fast_start_args(self) -> list[str]:
+        """
+        Returns:
+            list[str]: FAST_START_JVM_ARGS and argument to use (or to create on exit) AppCDS archive
+        """
+        appcds_archive = os.path.join(self._profile_parser.versions_dir, self._version_id, APPCDS_ARCHIVE)
+        if os.path.exists(appcds_archive):
+            return [*FAST_START_JVM_ARGS, f"-XX:SharedArchiveFile={appcds_archive}"]
+        logging.info("AppCDS archive will be created on exit: %s", appcds_archive)
+        return [*FAST_START_JVM_ARGS, f"-XX:ArchiveClassesAtExit={appcds_archive}"]
 
-    def _check_kill(self, stopping_timer: float) -> None:
-        """Checks if there is more then MINECRAFT_STOPPING_TIMEOUT after MINECRAFT_STOPPING_LOG and kills minecraft
+    def _get_assets(self, deps_builder_: DepsBuilder, libs_future: Future, cancel: Event) -> str | None:
+        """Resolves assets after libraries are resolved, so library files are queued first
 
         Args:
-            stopping_timer (float): time of MINECRAFT_STOPPING_LOG
+            deps_builder_ (DepsBuilder): dependency builder of current version
+            libs_future (Future): future of get_libraries()
+            cancel (Event): set to skip resolving assets (if libraries are not resolved yet)
+
+        Returns:
+            str | None: output of get_assets() or None if libraries failed or resolving is canceled
         """
-        if stopping_timer != 0 and time.time() - stopping_timer > MINECRAFT_STOPPING_TIMEOUT:
+        if libs_future.exception() is not None or libs_future.result() is None or cancel.is_set():
+            return None
+        return deps_builder_.get_assets()
+
+    def _kill_stuck(self) -> None:
+        """Kills minecraft if it's still running MINECRAFT_STOPPING_TIMEOUT seconds after MINECRAFT_STOPPING_LOG"""
+        if self._minecraft_process.poll() is None:
             logging.warning("Minecraft process was unable to finish by itself. Killing it")
             self._minecraft_process.kill()
-            time.sleep(1)
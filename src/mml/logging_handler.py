@@ -18,22 +18,45 @@ If not, see <http://www.gnu.org/licenses/>.
 import logging
 import logging.handlers
 import multiprocessing
-import queue
-import time
-from ctypes import c_bool
+import sys
+import threading
 
 # Logging formatter
 FORMATTER_FMT = "[%(asctime)s] [%(levelname)-.1s] %(message)s"
 FORMATTER_FMT_SUFFIX = "[%(asctime)s] [%(levelname)-.1s] [{suffix}] %(message)s"
 FORMATTER_DATEFMT = "%Y-%m-%d %H:%M:%S"
 
+# Put into logging queue to flush handlers (see LoggingHandler.flush())
+FLUSH_REQUEST = "flush"
 
-def worker_configurer(queue_: multiprocessing.Queue, suffix: str | None = None):
+# Max time to wait for handlers to flush (in seconds)
+FLUSH_TIMEOUT = 5.0
+
+
+class CompactQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that sends only (name, levelno, formatted message) tuples instead of pickling whole LogRecord
+    Listener only needs these fields, because message is already formatted in the sender process
+    """
+
+    def prepare(self, record: logging.LogRecord) -> tuple[str, int, str]:
+        """Formats record (including exception info)
+
+        Args:
+            record (logging.LogRecord): logging record to send
+
+        Returns:
+            tuple[str, int, str]: (logger name, level number, formatted message)
+        """
+        return record.name, record.levelno, self.format(record)
+
+
+def worker_configurer(queue_: multiprocessing.Queue, suffix: str | None = None, level: int = logging.DEBUG):
     """Call this method in your process
 
     Args:
         queue (multiprocessing.Queue): logging queue
         suffix (str | None, optional): suffix for formatter for current process. Defaults to None
+        level (int, optional): minimal level of records to send. Defaults to logging.DEBUG
     """
     # Remove all current handlers
     root_logger = logging.getLogger()
@@ -42,9 +65,9 @@ def worker_configurer(queue_: multiprocessing.Queue, suffix: str | None = None):
             root_logger.removeHandler(handler)
 
     # Setup queue handler
-    queue_handler = logging.handlers.QueueHandler(queue_)
+    queue_handler = CompactQueueHandler(queue_)
     root_logger.addHandler(queue_handler)
-    root_logger.setLevel(logging.DEBUG)
+    root_logger.setLevel(level)
 
     # Configure formatter
     formatter = logging.Formatter(
@@ -56,6 +79,71 @@ def worker_configurer(queue_: multiprocessing.Queue, suffix: str | None = None):
     logging.debug(f"Logging setup is complete for process with PID: {multiprocessing.current_process().pid}")
 
 
+class _QueueListener(logging.handlers.QueueListener):
+    """QueueListener for CompactQueueHandler's tuples that also handles flush requests and stop sentinel"""
+
+    def __init__(self, queue_: multiprocessing.Queue, handler: logging.Handler, level: int, flushed):
+        """Initializes _QueueListener instance
+
+        Args:
+            queue_ (multiprocessing.Queue): logging queue
+            handler (logging.Handler): handler for records from queue_
+            level (int): minimal logging level
+            flushed (multiprocessing.Event): will be set after each FLUSH_REQUEST
+        """
+        super().__init__(queue_, handler, respect_handler_level=True)
+        self.level = level
+        self.flushed = flushed
+        self.stopped = threading.Event()
+
+    def dequeue(self, block: bool) -> tuple[str, int, str] | str | None:
+        """Gets record from the queue and marks listener as stopped on None
+
+        Args:
+            block (bool): True to wait for the record
+
+        Returns:
+            tuple[str, int, str] | str | None: record from CompactQueueHandler, FLUSH_REQUEST or None to stop
+        """
+        record = self.queue.get(block)
+        if record is None:
+            self.stopped.set()
+        return record
+
+    def prepare(self, record: tuple[str, int, str]) -> logging.LogRecord:
+        """Converts record from CompactQueueHandler back into LogRecord
+
+        Args:
+            record (tuple[str, int, str]): (logger name, level number, formatted message)
+
+        Returns:
+            logging.LogRecord: record with already formatted message
+        """
+        name, levelno, message = record
+        return logging.makeLogRecord(
+            {"name": name, "levelno": levelno, "levelname": logging.getLevelName(levelno), "msg": message}
+        )
+
+    def handle(self, record: tuple[str, int, str] | str) -> None:
+        """Handles record from the queue or flushes handlers on FLUSH_REQUEST
+
+        Args:
+            record (tuple[str, int, str] | str): record from CompactQueueHandler or FLUSH_REQUEST
+        """
+        # Flush handlers and notify flush()
+        if record == FLUSH_REQUEST:
+            for handler in self.handlers:
+                handler.flush()
+            self.flushed.set()
+            return
+
+        # Skip empty messages and lower levels
+        if record[2] is None or record[1] < self.level:
+            return
+
+        super().handle(record)
+
+
 class LoggingHandler:
     def __init__(self, verbose: bool = False):
         """Initializer LoggingHandler instance
@@ -66,7 +154,7 @@ class LoggingHandler:
         self._verbose = verbose
 
         self._queue = multiprocessing.Queue(-1)
-        self._flush_request = multiprocessing.Value(c_bool, False)
+        self._flushed = multiprocessing.Event()
 
     @property
     def queue_(self) -> multiprocessing.Queue:
@@ -77,22 +165,14 @@ class LoggingHandler:
         return self._queue
 
     def flush(self) -> None:
-        """Requests handlers flush and waits until flushed"""
-        with self._flush_request.get_lock():
-            self._flush_request.value = True
-        while True:
-            with self._flush_request.get_lock():
-                flush_request = self._flush_request.value
-            if not flush_request:
-                break
-            time.sleep(0.01)
+        """Requests handlers flush and waits until all previous records are handled and flushed"""
+        self._flushed.clear()
+        self._queue.put(FLUSH_REQUEST)
+        if not self._flushed.wait(timeout=FLUSH_TIMEOUT):
+            print(f"Logging handlers were not flushed in {FLUSH_TIMEOUT:.0f}s", file=sys.stderr)
 
     def configure_and_start_listener(self):
         """Initializes logging and starts listening. Send None to queue to stop it"""
-        # This import must be here
-        # pylint: disable-next=import-outside-toplevel
-        import sys
-
         # Setup logging into console
         console_handler = logging.StreamHandler(sys.stdout)
 
@@ -102,46 +182,12 @@ class LoggingHandler:
         root_logger.addHandler(console_handler)
         root_logger.setLevel(level)
 
-        # Start queue listener
-        while True:
-            try:
-                # Handle flush request
-                with self._flush_request.get_lock():
-                    if self._flush_request.value:
-                        logging.debug("Flushing logging handlers")
-                        for handler in root_logger.handlers:
-                            handler.flush()
-                    self._flush_request.value = False
-
-                # Get logging record (non-blocking)
-                try:
-                    record = self._queue.get(block=False)
-                except queue.Empty:
-                    time.sleep(0.1)
-                    continue
-
-                # Send None to exit
-                if record is None:
-                    break
-
-                # Skip empty messages and lower levels
-                if record.message is None or record.levelno < level:
-                    continue
-
-                # Handle current logging record
-                logger = logging.getLogger(record.name)
-                logger.handle(record)
-
+        # Handle records in background thread until None is received
+        listener = _QueueListener(self._queue, console_handler, level, self._flushed)
+        listener.start()
+        while not listener.stopped.is_set():
             # Ignore Ctrl+C (call queue.put(None) to stop this listener)
+            try:
+                listener.stopped.wait()
             except (SystemExit, KeyboardInterrupt):
                 pass
-
-            # Error! WHY???
-            except Exception:
-                # pylint: disable=import-outside-toplevel
-                import traceback
-
-                # pylint: enable=import-outside-toplevel
-
-                print("Logging error: ", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
@@ -23,23 +23,26 @@ import multiprocessing
 import os
 import shlex
 import shutil
+import stat
 import subprocess
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
 
-import certifi
-import requests
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from mml._version import __version__
-from mml.config_manager import CONFIG_DEFAULT, ConfigManager
-from mml.file_resolver import FileResolver
-from mml.jdk_check_install import jdk_check_install
-from mml.launcher import Launcher, State
+from mml.config_manager import ConfigManager, config_default
 from mml.logging_handler import LoggingHandler, worker_configurer
-from mml.profile_parser import ProfileParser
 from mml.rules_check import os_name
 
+# NOTE: requests, certifi and launcher modules are imported inside functions that need them,
+# so -h and --version (and spawned processes on Windows) don't pay for importing them
+
 CONFIG_FILE_DEFAULT_PATH = ".micro-minecraft-launcher.json"
 
 EXAMPLE_USAGE = """examples:
@@ -59,6 +62,12 @@ LAUNCHER_PROFILES_ICON_DEFAULT = "Grass"
 # For update checking
 TIMEOUT = 30
 
+# Max time to wait for launcher thread at once (to handle interrupts)
+WAIT_TIMEOUT = 0.5
+
+# Max number of threads to delete files with
+DELETE_WORKERS_MAX = min(32, 4 * (os.cpu_count() or 1))
+
 
 def parse_args() -> argparse.Namespace:
     """Parses cli arguments
@@ -86,7 +95,7 @@ def parse_args() -> argparse.Namespace:
         type=str,
         required=False,
         default=None,
-        help=f"path to .minecraft (Default: {CONFIG_DEFAULT['game_dir']})",
+        help=f"path to .minecraft (Default: {config_default()['game_dir']})",
     )
     parser.add_argument(
         "-l",
@@ -163,6 +172,13 @@ def parse_args() -> argparse.Namespace:
         " NOTE: If an argument contains spaces, you should define it with double quotes: -j '-foo \"multiple words\"'"
         ' NOTE: Will append to the bottom of "jvm_args" from config file',
     )
+    parser.add_argument(
+        "--fast-start",
+        action="store_true",
+        default=False,
+        help="start JVM faster using C1 compiler only and AppCDS archive (created on the first launch)"
+        " NOTE: May lower performance during long game sessions",
+    )
     parser.add_argument(
         "-g",
         "--game-args",
@@ -180,7 +196,7 @@ def parse_args() -> argparse.Namespace:
         required=False,
         default=None,
         help="number of processes to resolve (download, copy and unpack) files"
-        f"(Default: {CONFIG_DEFAULT['resolver_processes']})",
+        f"(Default: {config_default()['resolver_processes']})",
     )
     parser.add_argument(
         "--write-profiles",
@@ -290,6 +306,10 @@ def key_value_pairs_to_dict(key_values: list[str] | None, separator: str = "=")
 def check_mml_version() -> None:
     """Checks for latest tag on GitHub and prints it"""
     logging.info("Checking for updates")
+
+    # pylint: disable-next=import-outside-toplevel
+    import requests
+
     try:
         response = requests.get("https://api.github.com/repos/F33RNI/micro-minecraft-launcher/tags", timeout=TIMEOUT)
         if response.ok:
@@ -324,22 +344,23 @@ def write_profiles(game_dir: str, versions: list[dict]) -> None:
     launcher_profiles = {}
     if os.path.exists(launcher_profiles_file_path):
         logging.info(f"Found existing {launcher_profiles_file_path} file. Reading it")
-        with open(launcher_profiles_file_path, "r", encoding="utf-8") as launcher_profiles_io:
-            launcher_profiles = json.load(launcher_profiles_io)
+        if orjson is not None:
+            with open(launcher_profiles_file_path, "rb") as launcher_profiles_io:
+                launcher_profiles = orjson.loads(launcher_profiles_io.read())
+        else:
+            with open(launcher_profiles_file_path, "r", encoding="utf-8") as launcher_profiles_io:
+                launcher_profiles = json.load(launcher_profiles_io)
 
     profiles = launcher_profiles.get("profiles", {})
+    existing_ids = {profile.get("lastVersionId") for profile in profiles.values()}
     for version in versions:
         if not version.get("local"):
             continue
 
-        version_exists = False
-        for _, profile in profiles.items():
-            if profile.get("lastVersionId") == version["id"]:
-                version_exists = True
-                break
-        if version_exists:
+        if version["id"] in existing_ids:
             logging.debug(f"Not adding {version['id']} to {LAUNCHER_PROFILES_FILE}. Already exists")
             continue
+        existing_ids.add(version["id"])
 
         logging.debug(f"Adding {version['id']} to {LAUNCHER_PROFILES_FILE}")
         profiles[uuid4().hex] = {
@@ -355,6 +376,7 @@ def write_profiles(game_dir: str, versions: list[dict]) -> None:
     launcher_profiles["version"] = launcher_profiles.get("launcher_profiles", 3)
     logging.debug(f"Launcher profiles to write {launcher_profiles}")
 
+    # Always written by json, so file format doesn't depend on whether orjson is installed
     logging.info(f"Writing launcher profiles into {launcher_profiles_file_path}")
     with open(launcher_profiles_file_path, "w+", encoding="utf-8") as launcher_profiles_io:
         json.dump(launcher_profiles, launcher_profiles_io, ensure_ascii=False, indent=4)
@@ -384,15 +406,12 @@ def run_before(command: str, cwd: str) -> bool:
 
     # Redirect logs and capture CTRL+C
     try:
-        while process.poll() is None:
-            # Read logs from STOUT (blocking)
-            stdout = process.stdout.readline()
-            if not stdout:
-                continue
-
-            # Redirect log
+        # Read logs from STOUT (blocking) until process closes it
+        for stdout in process.stdout:
             log_line = stdout.decode("utf-8", errors="replace").strip()
-            logging.info(f"[Run before] {log_line}")
+            logging.info("[Run before] %s", log_line)
+        process.stdout.close()
+        process.wait()
 
     except (SystemExit, KeyboardInterrupt) as e:
         logging.warning("Interrupted! Killing run-before process")
@@ -411,27 +430,59 @@ def run_before(command: str, cwd: str) -> bool:
     return True
 
 
+def _delete_file(file: str, is_dir: bool) -> None:
+    """Deletes file or directory and logs error if failed
+
+    Args:
+        file (str): path to file or directory
+        is_dir (bool): True if file is a directory (not a symlink to it)
+    """
+    logging.warning(f"Deleting {file}")
+    try:
+        if is_dir:
+            shutil.rmtree(file)
+        else:
+            os.remove(file)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.error(f"Error deleting {file}: {e}")
+        logging.debug("Error details", exc_info=e)
+
+
 def delete_files(delete_patterns: list[str]) -> None:
     """Deletes files using glob patterns
+    Files are deleted by multiple threads, because it's limited by filesystem latency (ex. network drives)
 
     Args:
         delete_patterns (list[str]): patterns for glob.glob
     """
     logging.debug(f"delete_patterns: {' '.join(delete_patterns)}")
+
+    # {absolute path: is directory, ...} (the same file can match multiple patterns)
+    files = {}
     for delete_pattern in delete_patterns:
-        for file in glob.glob(delete_pattern):
-            logging.debug(f"Found file {file} in pattern {delete_pattern} to delete")
-            logging.warning(f"Deleting {file}")
+        # No need to search for plain paths
+        matches = glob.iglob(delete_pattern) if glob.has_magic(delete_pattern) else (delete_pattern,)
+        for file in matches:
+            # Single stat call per file (symlinks are removed, not followed)
             try:
-                if os.path.isdir(file):
-                    shutil.rmtree(file, ignore_errors=True)
-                    if os.path.exists(file):
-                        os.rmdir(file)
-                else:
-                    os.remove(file)
-            except Exception as e:
-                logging.error(f"Error deleting {file}: {e}")
-                logging.debug("Error details", exc_info=e)
+                file_stat = os.lstat(file)
+            except FileNotFoundError:
+                continue
+
+            logging.debug(f"Found file {file} in pattern {delete_pattern} to delete")
+            files[os.path.abspath(file)] = stat.S_ISDIR(file_stat.st_mode)
+
+    # Skip files inside directories that will be deleted anyway
+    dirs_prefixes = tuple(file + os.sep for file, is_dir in files.items() if is_dir)
+    files = {file: is_dir for file, is_dir in files.items() if not file.startswith(dirs_prefixes)}
+    if not files:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(len(files), DELETE_WORKERS_MAX)) as executor:
+        for _ in executor.map(_delete_file, files.keys(), files.values()):
+            pass
 
 
 def main():
@@ -443,11 +494,21 @@ def main():
     args = parse_args()
     launcher_ = None
 
+    # pylint: disable=import-outside-toplevel
+    import certifi
+
+    from mml.file_resolver import FileResolver
+    from mml.jdk_check_install import jdk_check_install
+    from mml.launcher import Launcher
+    from mml.profile_parser import ProfileParser
+
+    # pylint: enable=import-outside-toplevel
+
     # Initialize logging and start logging listener as process
     logging_handler_ = LoggingHandler(verbose=args.verbose)
     logging_handler_process = multiprocessing.Process(target=logging_handler_.configure_and_start_listener)
     logging_handler_process.start()
-    worker_configurer(logging_handler_.queue_)
+    worker_configurer(logging_handler_.queue_, level=logging.DEBUG if args.verbose else logging.INFO)
 
     # Fix SSL: CERTIFICATE_VERIFY_FAILED
     cert_file = certifi.where()
@@ -530,6 +591,9 @@ def main():
             isolate_profile = config_manager_.get("isolate_profile", ignore_args=True)
             if args.isolate:
                 isolate_profile = True
+            fast_start = config_manager_.get("fast_start", ignore_args=True)
+            if args.fast_start:
+                fast_start = True
             java_path = config_manager_.get("java_path")
 
             # Save for future sessions
@@ -545,6 +609,8 @@ def main():
                 config_manager_.set("user_type", user_type)
             if isolate_profile is not None:
                 config_manager_.set("isolate_profile", isolate_profile)
+            if fast_start is not None:
+                config_manager_.set("fast_start", fast_start)
             if java_path is not None:
                 config_manager_.set("java_path", java_path)
 
@@ -581,11 +647,13 @@ def main():
                 java_path=java_path,
                 extra_jvm_args=extra_jvm_args,
                 extra_game_args=extra_game_args,
+                fast_start=bool(fast_start),
             )
             launcher_.start()
 
-            while launcher_.state != State.IDLE and launcher_.state != State.ERROR:
-                time.sleep(1)
+            # Wait with timeout, so Ctrl+C is handled on Windows too
+            while not launcher_.wait_finished(timeout=WAIT_TIMEOUT):
+                pass
 
         # No version to launch provided
         else:
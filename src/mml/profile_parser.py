@@ -23,6 +23,11 @@ import os
 import requests
 from dateutil import parser
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from mml._version import LAUNCHER_VERSION
 from mml.artifact import Artifact
 from mml.resolve_artifact import resolve_artifact
@@ -141,8 +146,7 @@ class ProfileParser:
                 # Try to parse it's JSON
                 try:
                     logging.debug(f"Trying to parse {version_json}")
-                    with open(version_json, "r", encoding="utf-8") as version_json_io:
-                        version = json.load(version_json_io)
+                    version = self._load_json(version_json)
 
                     # Check required keys
                     if (
@@ -183,7 +187,8 @@ class ProfileParser:
         try:
             response = requests.get(MANIFEST_URL, timeout=TIMEOUT)
             if response.ok:
-                manifest_versions = json.loads(response.text).get("versions", [])
+                manifest = orjson.loads(response.content) if orjson is not None else json.loads(response.text)
+                manifest_versions = manifest.get("versions", [])
                 for manifest_version in manifest_versions:
                     # Check for required keys (just in case)
                     skip = False
@@ -226,8 +231,7 @@ class ProfileParser:
         """
         path_to_json = os.path.join(self.versions_dir, path_to_json)
         logging.debug(f"Parsing {path_to_json}")
-        with open(path_to_json, "r", encoding="utf-8") as version_json_io:
-            version_json = json.load(version_json_io)
+        version_json = self._load_json(path_to_json)
 
         # Check version
         min_launcher_version = version_json.get("minimumLauncherVersion", 0)
@@ -277,3 +281,18 @@ class ProfileParser:
                 return None
 
         return version_info["path"]
+
+    def _load_json(self, path: str) -> dict:
+        """Loads JSON file (using orjson if it's installed)
+
+        Args:
+            path (str): path to JSON file
+
+        Returns:
+            dict: parsed JSON
+        """
+        if orjson is not None:
+            with open(path, "rb") as json_io:
+                return orjson.loads(json_io.read())
+        with open(path, "r", encoding="utf-8") as json_io:
+            return json.load(json_io)
@@ -17,16 +17,25 @@ If not, see <http://www.gnu.org/licenses/>.
 
 import logging
 import os
+import random
 import shutil
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from zipfile import ZipFile
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 import requests
+from requests.adapters import HTTPAdapter
 
-from mml.artifact import Artifact
+from mml.artifact import VERIFIED_SUFFIX, Artifact
 
 # For downloading file from stream
-CHUNK_SIZE = 8192
+CHUNK_SIZE = 1 << 20
 
 # Requests timeout
 TIMEOUT = 240
@@ -34,11 +43,171 @@ TIMEOUT = 240
 # How many download attempts are allowed (1 - no retries)
 DOWNLOAD_ATTEMPTS = 3
 
-# Delay between attempts
+# Delay before the second attempt. Doubled for each next attempt
 ATTEMPT_DELAY = 1.0
 
+# Max random delay added to ATTEMPT_DELAY so workers don't retry simultaneously
+ATTEMPT_JITTER = 0.5
+
+# Artifacts larger than this are downloaded using PARALLEL_DOWNLOAD_CONNECTIONS range requests
+PARALLEL_DOWNLOAD_MIN_SIZE = 4 << 20
+PARALLEL_DOWNLOAD_CONNECTIONS = 4
+
+# Number of kept-alive connections per host
+POOL_CONNECTIONS = 16
+
+# Each thread of each resolver process has it's own session
+_local = threading.local()
+
+# Directories that are known to exist (per process)
+_existing_dirs = set()
+
+# Threads for range requests of _download_parallel() (per process). Threads are kept alive,
+# so their sessions (and connections) are reused between downloads
+_range_executor: ThreadPoolExecutor | None = None
+_range_executor_pid = None
+
+
+def _get_session() -> requests.Session:
+    """Returns session of the current thread so connections (and TLS handshakes) are reused between artifacts
+    Session is recreated after fork because sockets must not be shared with the parent process
+
+    Returns:
+        requests.Session: session with connection pool
+    """
+    session = getattr(_local, "session", None)
+    if session is None or _local.pid != os.getpid():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_CONNECTIONS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+        _local.pid = os.getpid()
+    return session
+
+
+def _get_range_executor() -> ThreadPoolExecutor:
+    """Returns executor for range requests of the current process
+    Executor is recreated after fork because threads are not copied into the child process
+
+    Returns:
+        ThreadPoolExecutor: executor with PARALLEL_DOWNLOAD_CONNECTIONS threads
+    """
+    global _range_executor, _range_executor_pid
+    if _range_executor is None or _range_executor_pid != os.getpid():
+        _range_executor = ThreadPoolExecutor(max_workers=PARALLEL_DOWNLOAD_CONNECTIONS)
+        _range_executor_pid = os.getpid()
+    return _range_executor
+
+
+def _makedirs(dir_path: str) -> None:
+    """Creates directory if it doesn't exist. Checks each directory only once per process
+
+    Args:
+        dir_path (str): path to directory
+    """
+    if dir_path in _existing_dirs:
+        return
+    if not os.path.exists(dir_path):
+        logging.debug(f"Creating {dir_path} directory")
+
+        # Other resolver process may create it at the same time
+        os.makedirs(dir_path, exist_ok=True)
+    _existing_dirs.add(dir_path)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Creates hard link (or copy-on-write clone) of file if possible or copies it otherwise
+
+    Args:
+        src (str): existing file
+        dst (str): new file
+    """
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+
+    # Reflink (btrfs, XFS, ...). Linux with Python >= 3.12 only
+    if fcntl is not None and hasattr(fcntl, "FICLONE"):
+        try:
+            with open(src, "rb") as src_io, open(dst, "wb") as dst_io:
+                fcntl.ioctl(dst_io.fileno(), fcntl.FICLONE, src_io.fileno())
+            return
+        except OSError:
+            pass
 
-def resolve_artifact(artifact_: Artifact, _attempt: int = 0, verify_checksums: bool = True) -> str | None:
+    shutil.copyfile(src, dst)
+
+
+def _download_range(url: str, start: int, end: int, file_path: str) -> None:
+    """Downloads bytes from start to end (inclusive) and writes them into file at the same offset
+
+    Args:
+        url (str): url of file to download
+        start (int): first byte
+        end (int): last byte
+        file_path (str): existing file to write into
+
+    Raises:
+        Exception: in case of download error or if server doesn't support range requests
+    """
+    with _get_session().get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=TIMEOUT, stream=True) as response:
+        if response.status_code != 206:
+            raise Exception(f"Range request is not supported: {response.status_code}")
+        with open(file_path, "r+b") as file_io:
+            file_io.seek(start)
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    file_io.write(chunk)
+            if file_io.tell() != end + 1:
+                raise Exception(f"Received {file_io.tell() - start} bytes instead of {end - start + 1}")
+
+
+def _download_parallel(url: str, size: int, file_path: str) -> bool:
+    """Downloads file by PARALLEL_DOWNLOAD_CONNECTIONS simultaneous range requests
+
+    Args:
+        url (str): url of file to download
+        size (int): expected size of file
+        file_path (str): where to save file
+
+    Returns:
+        bool: True if downloaded or False in case of error (ex. server doesn't support ranges)
+    """
+    logging.info(
+        f"Downloading {os.path.basename(file_path)} from {url} using {PARALLEL_DOWNLOAD_CONNECTIONS} connections"
+    )
+    part_size = -(-size // PARALLEL_DOWNLOAD_CONNECTIONS)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+    try:
+        with open(file_path, "wb") as file_io:
+            file_io.truncate(size)
+
+        executor = _get_range_executor()
+        futures = [executor.submit(_download_range, url, start, end, file_path) for start, end in ranges]
+        try:
+            for future in futures:
+                future.result()
+
+        # Don't leave other parts writing into the file after error
+        finally:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+
+        with open(file_path, "r+b") as file_io:
+            os.fsync(file_io.fileno())
+    except Exception as e:
+        logging.warning(f"Unable to download {url} using multiple connections: {e}")
+        logging.debug("Error details", exc_info=e)
+        return False
+
+    return True
+
+
+def resolve_artifact(artifact_: Artifact, verify_checksums: bool = True) -> str | None:
     """Checks if artifact exists (and verifies it's checksum) and downloads it if not
     Also, copies and unpacks it if needed
 
@@ -49,8 +218,8 @@ def resolve_artifact(artifact_: Artifact, _attempt: int = 0, verify_checksums: b
     Returns:
         str | None: path to artifact if exists or downloaded successfully or None in case of error
     """
-    if artifact_.artifact_exists and (not verify_checksums or artifact_.verify_checksum()):
-        artifact_path = os.path.join(artifact_.parent_dir, artifact_.path)
+    if artifact_.artifact_exists and (not verify_checksums or artifact_.fast_verify()):
+        artifact_path = artifact_.artifact_path
         logging.debug(f"Artifact {artifact_path} exists")
         unpack_copy(artifact_, artifact_path)
         return artifact_path
@@ -63,43 +232,95 @@ def resolve_artifact(artifact_: Artifact, _attempt: int = 0, verify_checksums: b
         logging.warning("Unable to download artifact. No target path specified")
         return None
 
-    artifact_path = os.path.join(artifact_.parent_dir, artifact_.path)
-    artifact_dir = os.path.dirname(artifact_path)
+    artifact_path = artifact_.artifact_path
+    _makedirs(os.path.dirname(artifact_path))
 
-    if not os.path.exists(artifact_dir):
-        logging.debug(f"Creating {artifact_dir} directory")
-        os.makedirs(artifact_dir)
-
-    # Download
-    _attempt += 1
-    logging.info(f"Downloading {os.path.basename(artifact_path)} from {artifact_.url}")
+    # Artifact will be rewritten, so it's previous verification is no longer valid
     try:
-        response = requests.get(artifact_.url, timeout=TIMEOUT, stream=True)
-        if response.ok:
-            with open(artifact_path, "wb") as artifact_io:
-                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                    if chunk:
-                        artifact_io.write(chunk)
-                artifact_io.flush()
-                os.fsync(artifact_io.fileno())
+        os.remove(artifact_path + VERIFIED_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+    # Hash object and number of bytes of artifact_path that were fed into it (to resume download)
+    file_hash = None
+    bytes_downloaded = 0
+    parallel = True
+
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        # Wait a bit (longer after each failure to let server recover) and try again
+        if attempt > 1:
+            time.sleep(ATTEMPT_DELAY * 2 ** (attempt - 2) + random.uniform(0, ATTEMPT_JITTER))
+            logging.info(f"Trying to download again {attempt} / {DOWNLOAD_ATTEMPTS}")
+
+        # Continue interrupted download from the previous attempt
+        headers = {"Range": f"bytes={bytes_downloaded}-"} if bytes_downloaded else None
+
+        # Download large artifacts using multiple connections
+        downloaded = False
+        if parallel and bytes_downloaded == 0 and artifact_.size > PARALLEL_DOWNLOAD_MIN_SIZE:
+            # Parts are written at their offsets so checksum can only be calculated after downloading
+            file_hash = None
+            downloaded = _download_parallel(artifact_.url, artifact_.size, artifact_path)
+
+            # Server may not support ranges so don't try it again
+            parallel = downloaded
+
+        if not downloaded:
+            logging.info(f"Downloading {os.path.basename(artifact_path)} from {artifact_.url}")
+            try:
+                response = _get_session().get(artifact_.url, headers=headers, timeout=TIMEOUT, stream=True)
+                if response.ok:
+                    # Start from scratch if it's not a partial content (or server ignored Range header)
+                    if response.status_code != 206:
+                        bytes_downloaded = 0
+
+                    # Calculate checksum while downloading instead of reading downloaded file again
+                    if bytes_downloaded == 0:
+                        file_hash = artifact_.new_hasher() if verify_checksums else None
+
+                    with open(artifact_path, "r+b" if bytes_downloaded else "wb") as artifact_io:
+                        # Drop everything that was written but not hashed
+                        artifact_io.seek(bytes_downloaded)
+                        artifact_io.truncate()
+
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            if chunk:
+                                artifact_io.write(chunk)
+                                if file_hash is not None:
+                                    file_hash.update(chunk)
+                                bytes_downloaded += len(chunk)
+                        artifact_io.flush()
+                        os.fsync(artifact_io.fileno())
+                    downloaded = True
+                else:
+                    logging.error(
+                        f"Unable to download artifact from {artifact_.url}: {response.status_code}-{response.text}"
+                    )
+                    bytes_downloaded = 0
+            except Exception as e:
+                logging.error(f"Unable to download artifact from {artifact_.url}: {e}")
+                logging.debug("Error details", exc_info=e)
+
+        if not downloaded:
+            continue
+
+        # Check
+        if file_hash is not None:
+            valid = artifact_.verify_hasher(file_hash)
+            if valid:
+                artifact_.mark_verified()
         else:
-            logging.error(f"Unable to download artifact from {artifact_.url}: {response.status_code}-{response.text}")
-    except Exception as e:
-        logging.error(f"Unable to download artifact from {artifact_.url}: {e}")
-        logging.debug("Error details", exc_info=e)
+            valid = not verify_checksums or artifact_.fast_verify()
+        if valid and artifact_.artifact_exists:
+            break
 
-    # Check
-    if not artifact_.artifact_exists or (verify_checksums and not artifact_.verify_checksum()):
-        # Wait a bit and try again
-        if _attempt < DOWNLOAD_ATTEMPTS:
-            time.sleep(ATTEMPT_DELAY)
-            logging.info(f"Trying to download again {_attempt + 1} / {DOWNLOAD_ATTEMPTS}")
-            return resolve_artifact(artifact_, _attempt=_attempt)
+        # Download entire file again
+        bytes_downloaded = 0
 
-        # No more tries
-        else:
-            logging.info(f"Tried {_attempt} times. Giving up...")
-            return None
+    # No more tries
+    else:
+        logging.info(f"Tried {DOWNLOAD_ATTEMPTS} times. Giving up...")
+        return None
 
     logging.debug("Artifact downloaded successfully")
 
@@ -123,35 +344,27 @@ def unpack_copy(artifact_: Artifact, artifact_path: str) -> bool:
     if artifact_.unpack_into:
         logging.debug(f"Unpacking {artifact_path} into {artifact_.unpack_into}")
         try:
+            exclude_files = tuple(artifact_.exclude_files or ())
             with ZipFile(artifact_path, "r") as zip_io:
-                file_list = zip_io.namelist()
-                for file in file_list:
-                    exclude = False
-                    for exclude_file in artifact_.exclude_files:
-                        if file.startswith(exclude_file):
-                            exclude = True
-                            break
-                    if exclude:
-                        continue
-                    zip_io.extract(file, artifact_.unpack_into)
+                members = [file for file in zip_io.namelist() if not file.startswith(exclude_files)]
+                zip_io.extractall(artifact_.unpack_into, members=members)
         except Exception as e:
             logging.error(f"Unable to unpack {artifact_path}: {e}")
             logging.debug("Error details", exc_info=e)
             return False
 
     # Copy if needed
-    if artifact_.copy_to and not os.path.exists(artifact_.copy_to):
+    for copy_to in artifact_.copy_to or []:
+        if os.path.exists(copy_to):
+            continue
         try:
-            copy_to_dir = os.path.dirname(artifact_.copy_to)
-            if not os.path.exists(copy_to_dir):
-                logging.debug(f"Creating {copy_to_dir} directory")
-                os.makedirs(copy_to_dir, exist_ok=True)
+            _makedirs(os.path.dirname(copy_to))
 
-            logging.debug(f"Copying {artifact_path} into {artifact_.copy_to}")
-            shutil.copyfile(artifact_path, artifact_.copy_to)
+            logging.debug(f"Copying {artifact_path} into {copy_to}")
+            _link_or_copy(artifact_path, copy_to)
 
         except Exception as e:
-            logging.error(f"Unable to copy {artifact_path} into {artifact_.copy_to}: {e}")
+            logging.error(f"Unable to copy {artifact_path} into {copy_to}: {e}")
             logging.debug("Error details", exc_info=e)
             return False
 
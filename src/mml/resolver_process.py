@@ -20,74 +20,118 @@ import multiprocessing
 import queue
 import time
 from multiprocessing.sharedctypes import SynchronizedBase
+from multiprocessing.synchronize import Event
 
 from mml.logging_handler import worker_configurer
 from mml.resolve_artifact import resolve_artifact
 
-# To prevent overloading but must be small to prevent waiting between data
-LOOP_DELAY = 0.05
+# How long to wait for data before checking stop_flag again. Data itself is received immediately
+QUEUE_TIMEOUT = 0.25
+
+# bytes_processed is updated after this number of artifacts or this interval (in seconds), whichever comes first
+FLUSH_ARTIFACTS = 16
+FLUSH_INTERVAL = 0.5
+
+
+def _add_bytes(bytes_processed: SynchronizedBase, bytes_: int) -> None:
+    """Increments bytes_processed
+
+    Args:
+        bytes_processed (multiprocessing.Value): shared counter of processed bytes
+        bytes_ (int): value to add
+    """
+    with bytes_processed.get_lock():
+        bytes_processed.value += bytes_
 
 
 def resolver_process(
     id_: int,
     queue_: multiprocessing.Queue,
-    stop_flag: SynchronizedBase,
-    error_flag: SynchronizedBase,
+    items_pending: SynchronizedBase,
+    stop_flag: Event,
+    error_flag: Event,
     bytes_processed: SynchronizedBase,
     logging_queue: multiprocessing.Queue,
+    logging_level: int = logging.DEBUG,
 ) -> None:
-    """Retrieves artifact instances from the queue and processes (download, copy, unpack) them
+    """Retrieves artifact instances (or lists of them) from the queue and processes (download, copy, unpack) them
 
     Args:
         if_ (int): worker id (1 - ...) for logging
-        queue_ (multiprocessing.Queue): queue of artifact instances
-        stop_flag (multiprocessing.Value): set tot True to stop the process
-        error_flag (multiprocessing.Value): this will be set to True in case of error
+        queue_ (multiprocessing.Queue): queue of artifact instances or lists of them
+        items_pending (multiprocessing.Value): number of items in queue_. Will be decremented after getting an item
+        stop_flag (multiprocessing.Event): set it to stop the process
+        error_flag (multiprocessing.Event): this will be set in case of error
         bytes_processed (multiprocessing.Value): will be incremented with size of artifact after processing it
         logging_queue (multiprocessing.Queue): queue for worker_configurer()
+        logging_level (int, optional): minimal level of records to send. Defaults to logging.DEBUG
     """
     # Setup logging for current process
-    worker_configurer(logging_queue, suffix=f"D{id_:2}")
+    worker_configurer(logging_queue, suffix=f"D{id_:2}", level=logging_level)
 
-    # Process loop
-    while True:
-        # Non-blocking way to get data from the queue or exit by stop_flag
+    # Sizes of processed artifacts are accumulated and added to bytes_processed by batches to not lock it too often
+    bytes_pending = 0
+    artifacts_pending = 0
+    flush_timer = time.time()
+
+    try:
+        # Process loop
         while True:
-            with stop_flag.get_lock():
-                stop_flag_ = stop_flag.value
-            if stop_flag_:
-                logging.debug("resolver_process() finished")
+            # Wait for data from the queue or exit by stop_flag
+            while True:
+                if stop_flag.is_set():
+                    logging.debug("resolver_process() finished")
+                    return
+
+                try:
+                    data = queue_.get(timeout=QUEUE_TIMEOUT)
+                    with items_pending.get_lock():
+                        items_pending.value -= 1
+                    if data:
+                        break
+                except queue.Empty:
+                    # Nothing to process right now, so don't keep progress behind
+                    if bytes_pending:
+                        _add_bytes(bytes_processed, bytes_pending)
+                        bytes_pending = 0
+                        artifacts_pending = 0
+                        flush_timer = time.time()
+
+            # This must not cause any errors!
+            try:
+                # Single artifact or batch from FileResolver.add_artifacts()
+                for artifact_ in data if isinstance(data, list) else [data]:
+                    # Don't process the rest of the batch after stop request
+                    if stop_flag.is_set():
+                        logging.debug("resolver_process() finished")
+                        return
+
+                    if not resolve_artifact(artifact_):
+                        raise Exception("Unable to download artifact")
+
+                    # Increment by size of artifact
+                    bytes_pending += artifact_.size
+                    artifacts_pending += 1
+                    if artifacts_pending >= FLUSH_ARTIFACTS or time.time() - flush_timer >= FLUSH_INTERVAL:
+                        _add_bytes(bytes_processed, bytes_pending)
+                        bytes_pending = 0
+                        artifacts_pending = 0
+                        flush_timer = time.time()
+
+            # Catch SIGTERM and CTRL+C
+            except (SystemExit, KeyboardInterrupt):
+                logging.warning("Interrupted")
+                error_flag.set()
                 return
 
-            try:
-                data = queue_.get(block=False)
-                if data:
-                    break
-            except queue.Empty:
-                pass
-
-            time.sleep(LOOP_DELAY)
-
-        # This must not cause any errors!
-        try:
-            if not resolve_artifact(data):
-                raise Exception("Unable to download artifact")
-
-            # Increment by size of artifact
-            with bytes_processed.get_lock():
-                bytes_processed.value += data.size
-
-        # Catch SIGTERM and CTRL+C
-        except (SystemExit, KeyboardInterrupt):
-            logging.warning("Interrupted")
-            with error_flag.get_lock():
-                error_flag.value = True
-            return
-
-        # Main loop error -> set error flag and exit
-        except Exception as e_:
-            with error_flag.get_lock():
-                error_flag.value = True
-            logging.error(e_)
-            logging.debug("resolver_process() finished due to error or interrupt", exc_info=e_)
-            return
+            # Main loop error -> set error flag and exit
+            except Exception as e_:
+                error_flag.set()
+                logging.error(e_)
+                logging.debug("resolver_process() finished due to error or interrupt", exc_info=e_)
+                return
+
+    # Add the rest on exit
+    finally:
+        if bytes_pending:
+            _add_bytes(bytes_processed, bytes_pending)
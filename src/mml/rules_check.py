@@ -15,12 +15,14 @@ You should have received a copy of the GNU General Public License along with thi
 If not, see <http://www.gnu.org/licenses/>.
 """
 
+import functools
 import logging
 import platform
 import re
 import sys
 
 
+@functools.lru_cache(maxsize=None)
 def os_name() -> str:
     """
     Returns:
@@ -44,7 +46,7 @@ def rules_check(rules: list[dict], features: dict | None = None) -> bool:
     <https://minecraft.fandom.com/wiki/Client.json>
 
     Args:
-        rules (List[Dict]): ex.: [
+        rules (list[dict]): ex.: [
             {
                 "action": "allow"
             },
@@ -55,7 +57,7 @@ def rules_check(rules: list[dict], features: dict | None = None) -> bool:
                 }
             }
         ]
-        features (Dict | None, optional): {
+        features (dict | None, optional): {
             "is_demo_user": value,
             "has_custom_resolution": value
             "has_quick_plays_support": value,